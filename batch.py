@@ -0,0 +1,23 @@
+import os
+import json
+import argparse
+from components.batch import Session, run_batch
+from components.input import POLICIES
+
+def main():
+    parser = argparse.ArgumentParser(description='Run many headless GameScene sessions in parallel and aggregate their statistics.')
+    parser.add_argument('--sessions', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes, 1 runs every session in this process')
+    parser.add_argument('--ticks', type=int, default=10000, help='tick limit per session')
+    parser.add_argument('--policy', nargs='+', choices=sorted(POLICIES), default=['random'], help='policies assigned to sessions round-robin')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first session, the rest count up from it')
+    parser.add_argument('--render', action='store_true')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    sessions = [Session(args.seed + index, args.policy[index % len(args.policy)], args.ticks, args.render) for index in range(args.sessions)]
+    report = run_batch(sessions, args.workers)
+    print(json.dumps(report.to_dict(), indent=2) if args.json else report.format())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+import sys
+import json
+import argparse
+from components.benchmark import SCENARIOS, run_benchmarks, compare_narrow_phase
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the canned performance scenarios headless and compare them against a stored baseline.')
+    parser.add_argument('--scenario', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--ticks', type=int, help='timed ticks per scenario instead of each scenario\'s default')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per scenario, the fastest is reported')
+    parser.add_argument('--baseline', metavar='PATH', help='compare against the results stored in PATH')
+    parser.add_argument('--save-baseline', metavar='PATH', help='store the results in PATH as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed p50 tick time increase over the baseline, 0.25 = 25%%')
+    parser.add_argument('--memory-threshold', type=float, default=0.25, help='allowed peak memory increase over the baseline')
+    parser.add_argument('--narrow-phase', action='store_true', help='only run the micro-benchmark of overlap tables against GameObject.is_collide_with()')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    if args.narrow_phase:
+        print(json.dumps(compare_narrow_phase(), indent=2))
+        return
+
+    report = run_benchmarks(args.scenario, args.ticks, args.repeat)
+    comparisons = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            comparisons = report.compare(json.load(file), args.threshold, args.memory_threshold)
+    if args.save_baseline:
+        report.save(args.save_baseline)
+    if args.json:
+        print(json.dumps({'results': report.to_dict(), 'comparisons': comparisons}, indent=2))
+    else:
+        print(report.format(comparisons))
+    if comparisons is not None and any(comparison['regressed'] for comparison in comparisons):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
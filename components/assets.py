@@ -0,0 +1,103 @@
+import os
+import typing
+import threading
+import pygame
+
+Size = typing.Optional[typing.Tuple[int, int]]
+
+class SilentSound:
+    def play(self, *_, **__) -> None:
+        pass
+
+class AssetManager:
+    def __init__(self, root: str = 'assets') -> None:
+        self.root = root
+        self.sources: typing.Dict[str, pygame.Surface] = {}
+        self.images: typing.Dict[typing.Tuple[str, Size], pygame.Surface] = {}
+        self.scaled: typing.Dict[typing.Tuple[str, Size], pygame.Surface] = {}
+        self.masks: typing.Dict[typing.Tuple[str, Size], pygame.mask.Mask] = {}
+        self.sounds: typing.Dict[str, pygame.mixer.Sound] = {}
+        self.loads = 0
+        # Headless runs turn this off so they never open the mixer
+        self.audio = True
+        # Reentrant: image() loads the source and mask() converts the image while holding it. The render thread and the
+        # simulation ask for the same sprites at the same time, and pygame surfaces are not safe to convert concurrently
+        self.lock = threading.RLock()
+        self.preload_thread: typing.Optional[threading.Thread] = None
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def _source(self, name: str) -> pygame.Surface:
+        source = self.sources.get(name)
+        if source is not None: return source
+        with self.lock:
+            source = self.sources.get(name)
+            if source is None:
+                self.loads += 1
+                source = pygame.image.load(self.path(name))
+                self.sources[name] = source
+        return source
+
+    def image(self, name: str, size: Size = None, alpha: bool = True) -> pygame.Surface:
+        key = (name, size)
+        image = self.images.get(key)
+        if image is not None: return image
+
+        with self.lock:
+            image = self.images.get(key)
+            if image is not None: return image
+            # Until a display mode exists there is no pixel format to convert to, so the scaled surface is kept on its own
+            # and converted once there is one
+            scaled = self.scaled.get(key)
+            if scaled is None:
+                scaled = self._source(name)
+                if size is not None and scaled.get_size() != tuple(size):
+                    scaled = pygame.transform.scale(scaled, size)
+                self.scaled[key] = scaled
+            if pygame.display.get_surface() is None:
+                return scaled
+            image = scaled.convert_alpha() if alpha else scaled.convert()
+            self.images[key] = image
+            del self.scaled[key]
+            return image
+
+    def mask(self, name: str, size: Size = None) -> pygame.mask.Mask:
+        key = (name, size)
+        mask = self.masks.get(key)
+        if mask is not None: return mask
+        with self.lock:
+            mask = self.masks.get(key)
+            if mask is None:
+                mask = pygame.mask.from_surface(self.image(name, size))
+                self.masks[key] = mask
+        return mask
+
+    def sound(self, name: str) -> pygame.mixer.Sound:
+        sound = self.sounds.get(name)
+        if sound is None:
+            if not self.audio:
+                sound = SilentSound()
+            else:
+                if not pygame.mixer.get_init(): pygame.mixer.init()
+                sound = pygame.mixer.Sound(self.path(name))
+            self.sounds[name] = sound
+        return sound
+
+    def preload(self, names: typing.Iterable[str]) -> None:
+        for name in names:
+            self._source(name)
+
+    def preload_async(self, names: typing.Iterable[str]) -> None:
+        if self.preload_thread is not None and self.preload_thread.is_alive(): return
+        self.preload_thread = threading.Thread(target=self.preload, args=(list(names),), daemon=True)
+        self.preload_thread.start()
+
+    def clear(self) -> None:
+        self.sources.clear()
+        self.images.clear()
+        self.scaled.clear()
+        self.masks.clear()
+        self.sounds.clear()
+
+assets = AssetManager()
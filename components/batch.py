@@ -0,0 +1,105 @@
+import os
+import time
+import typing
+import concurrent.futures
+import utils.utils as utils
+from components.simulation import HeadlessRunner, RunReport
+
+class Session:
+    def __init__(self, seed: int, policy: str = 'random', ticks: int = 10000, render: bool = False) -> None:
+        self.seed = seed
+        self.policy = policy
+        self.ticks = ticks
+        self.render = render
+
+def run_session(session: Session) -> RunReport:
+    # Runs in a worker process: every process owns its own display and module caches
+    runner = HeadlessRunner(policy=session.policy, seed=session.seed, render=session.render)
+    return runner.run(session.ticks)
+
+class LevelSummary:
+    def __init__(self, level: int) -> None:
+        self.level = level
+        self.reached = 0
+        self.cleared = 0
+        self.lives_lost = 0
+        self.scores: typing.List[int] = []
+        self.ticks: typing.List[int] = []
+
+    def add(self, level: dict) -> None:
+        self.reached += 1
+        if level['cleared']: self.cleared += 1
+        self.lives_lost += level['lives_lost']
+        self.scores.append(level['score'])
+        self.ticks.append(level['ticks'])
+
+    def to_dict(self) -> dict:
+        return {
+            'level': self.level,
+            'reached': self.reached,
+            'survival_rate': self.cleared / self.reached,
+            'mean_lives_lost': self.lives_lost / self.reached,
+            'mean_score': sum(self.scores) / self.reached,
+            'mean_ticks': sum(self.ticks) / self.reached,
+        }
+
+class BatchReport:
+    def __init__(self, sessions: typing.List[Session], reports: typing.List[RunReport], wall_time: float, workers: int) -> None:
+        self.sessions = sessions
+        self.reports = reports
+        self.wall_time = wall_time
+        self.workers = workers
+        self.levels: typing.Dict[int, LevelSummary] = {}
+        for report in reports:
+            for level in report.levels:
+                self.levels.setdefault(level.level, LevelSummary(level.level)).add(level.to_dict())
+
+    def ticks(self) -> int:
+        return sum(report.ticks() for report in self.reports)
+
+    def to_dict(self) -> dict:
+        tick_times = [tick for report in self.reports for tick in report.tick_times]
+        scores = [report.score for report in self.reports]
+        return {
+            'sessions': len(self.reports),
+            'workers': self.workers,
+            'wall_seconds': self.wall_time,
+            'ticks': self.ticks(),
+            'ticks_per_second': self.ticks() / self.wall_time if self.wall_time > 0 else 0.0,
+            'tick_p50_ms': utils.percentile(tick_times, 50) * 1000,
+            'tick_p99_ms': utils.percentile(tick_times, 99) * 1000,
+            'score_mean': sum(scores) / len(scores) if len(scores) > 0 else 0.0,
+            'score_p50': utils.percentile(scores, 50),
+            'levels': [self.levels[level].to_dict() for level in sorted(self.levels)],
+            'runs': [{
+                'seed': session.seed,
+                'policy': session.policy,
+                'ticks': report.ticks(),
+                'level': report.levels[-1].level if len(report.levels) > 0 else 0,
+                'score': report.score,
+                'lives': report.lives,
+                'digest': report.digest,
+            } for session, report in zip(self.sessions, self.reports)],
+        }
+
+    def format(self) -> str:
+        data = self.to_dict()
+        lines = [
+            f'sessions: {data["sessions"]} on {self.workers} workers in {self.wall_time:.2f}s',
+            f'ticks: {data["ticks"]} ({data["ticks_per_second"]:.0f} ticks/s aggregate)',
+            f'tick p50: {data["tick_p50_ms"]:.3f} ms  p99: {data["tick_p99_ms"]:.3f} ms',
+            f'score mean: {data["score_mean"]:.1f}  p50: {data["score_p50"]}',
+        ]
+        for level in data['levels']:
+            lines.append(f'level {level["level"]}: reached {level["reached"]}, survival {level["survival_rate"]:.0%}, lives lost {level["mean_lives_lost"]:.2f}, score {level["mean_score"]:.1f}, ticks {level["mean_ticks"]:.0f}')
+        return '\n'.join(lines)
+
+def run_batch(sessions: typing.List[Session], workers: int = None) -> BatchReport:
+    workers = workers if workers is not None else os.cpu_count() or 1
+    start = time.perf_counter()
+    if workers <= 1:
+        reports = [run_session(session) for session in sessions]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            reports = list(executor.map(run_session, sessions))
+    return BatchReport(sessions, reports, time.perf_counter() - start, workers)
@@ -0,0 +1,227 @@
+import gc
+import json
+import time
+import typing
+import tracemalloc
+import numpy as np
+import pygame
+import utils.utils as utils
+from components.simulation import init_headless
+from components.scene import SceneManager, GameScene, StartScene
+from components.effect import EffectManager, SmokeUpEffect, SmokeCircleEffect, SparkleEffect
+from components.input import ScriptedInput, idle_policy
+from components.collision import overlap_tables
+
+# A scenario builds its state on the given screen and returns the function that runs one tick of it
+
+def _game(seed: int = 0, level: int = 1) -> typing.Tuple[SceneManager, GameScene]:
+    scene_manager = SceneManager()
+    scene = GameScene(scene_manager, ScriptedInput(idle_policy), seed)
+    # Nobody is playing, so keep the player alive for the whole scenario
+    scene.player.lives = 10 ** 9
+    scene.level = level - 1
+    scene.enemies_number = (level - 1) * GameScene.ENEMY_NUMBER
+    scene_manager.push(scene)
+    return scene_manager, scene
+
+def _game_tick(scene_manager: SceneManager, screen: pygame.Surface) -> None:
+    scene_manager.handle_events([])
+    scene_manager.update()
+    scene_manager.draw(screen)
+
+def level_1(screen: pygame.Surface) -> typing.Callable[[], None]:
+    scene_manager, _ = _game(level=1)
+    return lambda: _game_tick(scene_manager, screen)
+
+def level_20(screen: pygame.Surface) -> typing.Callable[[], None]:
+    scene_manager, _ = _game(level=20)
+    return lambda: _game_tick(scene_manager, screen)
+
+def crossfire(screen: pygame.Surface, bullets: int = 500) -> typing.Callable[[], None]:
+    scene_manager, scene = _game()
+    rng = np.random.RandomState(0)
+    width, height = screen.get_size()
+    def tick() -> None:
+        # Top both sides back up to half the bullets each, spread over the whole window
+        for store, vel, type_id in ((scene.player.bullets, GameScene.Player.PLAYER_BULLET_VEL, GameScene.Player.BULLET_YELLOW), (scene.enemy_bullets, GameScene.Enemy.ENEMY_BULLET_VEL, GameScene.Enemy.BULLET_RED)):
+            missing = bullets // 2 - len(store)
+            store.spawn_many(rng.uniform(0, width, missing), rng.uniform(0, height, missing), 0, vel, np.full(missing, type_id, dtype=np.int32))
+        _game_tick(scene_manager, screen)
+    return tick
+
+def _storm(screen: pygame.Surface, spawn: typing.Callable[[EffectManager, np.random.RandomState], None]) -> typing.Callable[[], None]:
+    # No governor: the point is to see what the effects themselves cost
+    effect_manager = EffectManager(np.random.RandomState(0))
+    rng = np.random.RandomState(1)
+    def tick() -> None:
+        spawn(effect_manager, rng)
+        screen.fill((0, 0, 0))
+        effect_manager.render(screen, 1)
+    return tick
+
+def smoke_storm(screen: pygame.Surface) -> typing.Callable[[], None]:
+    def spawn(effect_manager: EffectManager, rng: np.random.RandomState) -> None:
+        x, y, kind = rng.randint(0, 600), rng.randint(0, 600), rng.randint(0, 4)
+        if kind == 0: effect_manager.add_effect(SmokeCircleEffect(3, x, y, 15, effect_manager.rng))
+        else: effect_manager.add_effect(SmokeUpEffect(3, x, y, effect_manager.rng))
+    return _storm(screen, spawn)
+
+def sparkle_storm(screen: pygame.Surface) -> typing.Callable[[], None]:
+    def spawn(effect_manager: EffectManager, rng: np.random.RandomState) -> None:
+        for x, y in rng.randint(0, 600, (20, 2)).tolist():
+            effect_manager.add_effect(SparkleEffect(6, x, y, effect_manager.rng))
+    return _storm(screen, spawn)
+
+def hud_only(screen: pygame.Surface) -> typing.Callable[[], None]:
+    # The scene is drawn but never updated, so a frame is just background, player and a HUD that changes every tick
+    scene_manager, scene = _game()
+    def tick() -> None:
+        scene.player.score += 1
+        scene_manager.draw(screen)
+    return tick
+
+def start_idle(screen: pygame.Surface) -> typing.Callable[[], None]:
+    scene_manager = SceneManager()
+    scene_manager.push(StartScene(scene_manager))
+    def tick() -> None:
+        scene_manager.handle_events([])
+        scene_manager.update()
+        scene_manager.draw(screen)
+    return tick
+
+SCENARIOS = {
+    'level_1': (level_1, 600),
+    'level_20': (level_20, 600),
+    'crossfire': (crossfire, 600),
+    'smoke_storm': (smoke_storm, 200),
+    'sparkle_storm': (sparkle_storm, 300),
+    'hud_only': (hud_only, 1000),
+    'start_idle': (start_idle, 1000),
+}
+
+class ScenarioResult:
+    def __init__(self, name: str, tick_times: typing.List[float], peak_kb: float, retained_kb: float, gc_collections: int) -> None:
+        self.name = name
+        self.tick_times = tick_times
+        self.peak_kb = peak_kb
+        self.retained_kb = retained_kb
+        self.gc_collections = gc_collections
+
+    def tick_ms(self, q: float) -> float:
+        return utils.percentile(self.tick_times, q) * 1000
+
+    def to_dict(self) -> dict:
+        return {
+            'ticks': len(self.tick_times),
+            'mean_ms': sum(self.tick_times) / len(self.tick_times) * 1000,
+            'p50_ms': self.tick_ms(50),
+            'p99_ms': self.tick_ms(99),
+            'peak_kb': self.peak_kb,
+            'retained_kb': self.retained_kb,
+            'gc_collections_per_1k_ticks': self.gc_collections * 1000 / len(self.tick_times),
+        }
+
+def run_scenario(name: str, ticks: int = None, repeat: int = 3, warmup: int = 30) -> ScenarioResult:
+    factory, default_ticks = SCENARIOS[name]
+    ticks = ticks if ticks is not None else default_ticks
+    screen = init_headless()
+
+    # Timing runs without tracemalloc, which would slow every allocation down; the fastest repeat is kept
+    best: typing.List[float] = None
+    for _ in range(repeat):
+        tick = factory(screen)
+        for _ in range(warmup):
+            tick()
+        tick_times = []
+        for _ in range(ticks):
+            start = time.perf_counter()
+            tick()
+            tick_times.append(time.perf_counter() - start)
+        if best is None or sum(tick_times) < sum(best): best = tick_times
+
+    # A separate traced run gives peak and retained Python/numpy memory and how often allocations triggered the GC
+    gc.collect()
+    tracemalloc.start()
+    tick = factory(screen)
+    base, _ = tracemalloc.get_traced_memory()
+    collections = gc.get_stats()[0]['collections']
+    for _ in range(warmup + ticks):
+        tick()
+    current, peak = tracemalloc.get_traced_memory()
+    collections = gc.get_stats()[0]['collections'] - collections
+    tracemalloc.stop()
+    return ScenarioResult(name, best, (peak - base) / 1024, (current - base) / 1024, collections)
+
+class BenchReport:
+    def __init__(self, results: typing.List[ScenarioResult]) -> None:
+        self.results = results
+
+    def to_dict(self) -> dict:
+        return {result.name: result.to_dict() for result in self.results}
+
+    def save(self, path: str) -> None:
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+    def compare(self, baseline: dict, threshold: float = 0.25, memory_threshold: float = 0.25) -> typing.List[dict]:
+        comparisons = []
+        for name, current in self.to_dict().items():
+            if name not in baseline: continue
+            previous = baseline[name]
+            time_ratio = current['p50_ms'] / previous['p50_ms'] if previous['p50_ms'] > 0 else 1.0
+            # Peaks of a few KB are noise, so memory is only compared above 64 KB
+            memory_ratio = current['peak_kb'] / previous['peak_kb'] if previous['peak_kb'] > 64 else 1.0
+            comparisons.append({
+                'scenario': name,
+                'p50_ratio': time_ratio,
+                'peak_kb_ratio': memory_ratio,
+                'regressed': time_ratio > 1 + threshold or memory_ratio > 1 + memory_threshold,
+            })
+        return comparisons
+
+    def format(self, comparisons: typing.List[dict] = None) -> str:
+        ratios = {comparison['scenario']: comparison for comparison in comparisons or []}
+        lines = [f'{"scenario":<14} {"ticks":>6} {"mean ms":>8} {"p50 ms":>8} {"p99 ms":>8} {"peak KB":>9} {"kept KB":>8} {"gc/1k":>6}']
+        for name, result in self.to_dict().items():
+            line = f'{name:<14} {result["ticks"]:>6} {result["mean_ms"]:>8.3f} {result["p50_ms"]:>8.3f} {result["p99_ms"]:>8.3f} {result["peak_kb"]:>9.1f} {result["retained_kb"]:>8.1f} {result["gc_collections_per_1k_ticks"]:>6.1f}'
+            if name in ratios:
+                comparison = ratios[name]
+                line += f'  p50 x{comparison["p50_ratio"]:.2f} peak x{comparison["peak_kb_ratio"]:.2f}' + ('  REGRESSED' if comparison['regressed'] else '')
+            lines.append(line)
+        return '\n'.join(lines)
+
+def run_benchmarks(names: typing.Iterable[str], ticks: int = None, repeat: int = 3) -> BenchReport:
+    return BenchReport([run_scenario(name, ticks, repeat) for name in names])
+
+def compare_narrow_phase(samples: int = 100000, seed: int = 0) -> dict:
+    # Micro-benchmark of one pixel-perfect test: the mask walk of GameObject.is_collide_with() against the
+    # precomputed overlap tables, on the sprite pairs the game tests at offsets where their boxes touch
+    init_headless()
+    pairs = [(GameScene.Player.PLAYER_SHIP, ship) for ship in GameScene.Enemy.SHIP_TYPES]
+    pairs += [(GameScene.Player.BULLET_YELLOW, ship) for ship in GameScene.Enemy.SHIP_TYPES]
+    pairs += [(shot, GameScene.Player.PLAYER_SHIP) for shot in GameScene.Enemy.SHOT_TYPES]
+    rng = np.random.RandomState(seed)
+    tests = []
+    for index in rng.randint(0, len(pairs), samples).tolist():
+        first, second = GameScene.GameObject(0, 0, pairs[index][0]), GameScene.GameObject(0, 0, pairs[index][1])
+        second.x = int(rng.randint(1 - second.sprite.width, first.sprite.width))
+        second.y = int(rng.randint(1 - second.sprite.height, first.sprite.height))
+        tests.append((first, second))
+    for first, second in tests[:len(pairs) * 10]:
+        overlap_tables.get(first.sprite, second.sprite)
+
+    start = time.perf_counter()
+    walked = [first.is_collide_with(second) for first, second in tests]
+    walk_time = time.perf_counter() - start
+    start = time.perf_counter()
+    looked_up = [overlap_tables.get(first.sprite, second.sprite).overlaps(second.x - first.x, second.y - first.y) for first, second in tests]
+    table_time = time.perf_counter() - start
+    return {
+        'samples': samples,
+        'hit_rate': sum(walked) / samples,
+        'mask_walk_us': walk_time / samples * 1e6,
+        'table_us': table_time / samples * 1e6,
+        'speedup': walk_time / table_time,
+        'mismatches': sum(a != b for a, b in zip(walked, looked_up)),
+        'table_bytes': sum(len(table.bits) for table in overlap_tables.tables.values()),
+    }
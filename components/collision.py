@@ -0,0 +1,93 @@
+import typing
+from components.entity import SpriteType
+
+class CollisionStats:
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        self.candidates = 0
+        self.aabb_tests = 0
+        self.mask_tests = 0
+        self.hits = 0
+
+    def to_dict(self) -> typing.Dict[str, int]:
+        return {
+            'candidates': self.candidates,
+            'aabb_tests': self.aabb_tests,
+            'mask_tests': self.mask_tests,
+            'hits': self.hits,
+        }
+
+class SpatialHash:
+    def __init__(self, cell_size: int = 64) -> None:
+        self.cell_size = cell_size
+        self.cells: typing.Dict[typing.Tuple[int, int], list] = {}
+
+    def clear(self) -> None:
+        self.cells.clear()
+
+    def _cell_range(self, x: int, y: int, width: int, height: int) -> typing.Tuple[range, range]:
+        size = self.cell_size
+        return range(x // size, (x + width - 1) // size + 1), range(y // size, (y + height - 1) // size + 1)
+
+    def insert(self, item, x: int, y: int, width: int, height: int) -> None:
+        cols, rows = self._cell_range(x, y, width, height)
+        for cx in cols:
+            for cy in rows:
+                self.cells.setdefault((cx, cy), []).append(item)
+
+    def query(self, x: int, y: int, width: int, height: int) -> list:
+        cols, rows = self._cell_range(x, y, width, height)
+        found = []
+        seen = set()
+        for cx in cols:
+            for cy in rows:
+                for item in self.cells.get((cx, cy), ()):
+                    if item in seen: continue
+                    seen.add(item)
+                    found.append(item)
+        return found
+
+class OverlapTable:
+    # Whether two sprites overlap only depends on their offset, so every offset in the range where their boxes
+    # touch is answered once from the masks and afterwards looked up
+    def __init__(self, sprite1: SpriteType, sprite2: SpriteType) -> None:
+        self.dx = sprite2.width - 1
+        self.dy = sprite2.height - 1
+        # Bit (x, y) of the convolution is set when sprite2 at offset (x - dx, y - dy) overlaps sprite1
+        convolved = sprite1.mask.convolve(sprite2.mask)
+        self.width, self.height = convolved.get_size()
+        self.bits = bytes(convolved.get_at((x, y)) for y in range(self.height) for x in range(self.width))
+
+    def overlaps(self, dx: int, dy: int) -> bool:
+        x, y = dx + self.dx, dy + self.dy
+        if x < 0 or y < 0 or x >= self.width or y >= self.height: return False
+        return self.bits[y * self.width + x] == 1
+
+class OverlapTables:
+    def __init__(self) -> None:
+        self.tables: typing.Dict[typing.Tuple[int, int], OverlapTable] = {}
+
+    def get(self, sprite1: SpriteType, sprite2: SpriteType) -> OverlapTable:
+        key = (sprite1.type_id, sprite2.type_id)
+        table = self.tables.get(key)
+        if table is None:
+            table = self.tables[key] = OverlapTable(sprite1, sprite2)
+        return table
+
+overlap_tables = OverlapTables()
+
+def aabb(x1: int, y1: int, sprite1: SpriteType, x2: int, y2: int, sprite2: SpriteType) -> bool:
+    return x1 < x2 + sprite2.width and x2 < x1 + sprite1.width and y1 < y2 + sprite2.height and y2 < y1 + sprite1.height
+
+def overlap(x1: int, y1: int, sprite1: SpriteType, x2: int, y2: int, sprite2: SpriteType, stats: CollisionStats) -> bool:
+    stats.mask_tests += 1
+    if not overlap_tables.get(sprite1, sprite2).overlaps(x2 - x1, y2 - y1): return False
+    stats.hits += 1
+    return True
+
+def collide(x1: int, y1: int, sprite1: SpriteType, x2: int, y2: int, sprite2: SpriteType, stats: CollisionStats) -> bool:
+    stats.aabb_tests += 1
+    if not aabb(x1, y1, sprite1, x2, y2, sprite2): return False
+    return overlap(x1, y1, sprite1, x2, y2, sprite2, stats)
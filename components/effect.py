@@ -1,144 +1,345 @@
 import typing
 import pygame
-import random
 import math
+import time
+import collections
+import threading
+import numpy as np
 import utils.utils as utils
+from components.assets import assets
+from components.pool import PoolStats
 from abc import ABC, abstractmethod
 
+class QualityGovernor:
+    # (spawn scale, live particle cap, merge nearby effects) from full quality down
+    LEVELS = (
+        (1.0, 4000, False),
+        (0.5, 1500, True),
+        (0.25, 600, True),
+        (0.1, 200, True),
+    )
+    MERGE_RADIUS = 24
+
+    def __init__(self, budget_ms: float = 2.0, window: int = 30, degrade_after: int = 10, restore_after: int = 120, restore_ratio: float = 0.5) -> None:
+        self.budget_ms = budget_ms
+        self.degrade_after = degrade_after
+        self.restore_after = restore_after
+        self.restore_ratio = restore_ratio
+        self.frame_times: typing.Deque[float] = collections.deque(maxlen=window)
+        self.level = 0
+        self.frames_at_level = 0
+        self.dropped_particles = 0
+        self.merged_effects = 0
+
+    def record(self, frame_ms: float) -> None:
+        self.frame_times.append(frame_ms)
+        self.frames_at_level += 1
+        mean = sum(self.frame_times) / len(self.frame_times)
+        # Degrade quickly, restore only after a long stretch of headroom so quality does not oscillate
+        if mean > self.budget_ms and self.level < len(QualityGovernor.LEVELS) - 1 and self.frames_at_level >= self.degrade_after:
+            self.set_level(self.level + 1)
+        elif mean < self.budget_ms * self.restore_ratio and self.level > 0 and self.frames_at_level >= self.restore_after:
+            self.set_level(self.level - 1)
+
+    def set_level(self, level: int) -> None:
+        self.level = level
+        self.frames_at_level = 0
+        self.frame_times.clear()
+
+    def spawn_scale(self) -> float:
+        return QualityGovernor.LEVELS[self.level][0]
+
+    def max_particles(self) -> int:
+        return QualityGovernor.LEVELS[self.level][1]
+
+    def merge(self) -> bool:
+        return QualityGovernor.LEVELS[self.level][2]
+
+    def to_dict(self) -> typing.Dict[str, float]:
+        # Read from the main thread while the render thread may be clearing frame_times in set_level()
+        times = list(self.frame_times)
+        return {
+            'quality_level': self.level,
+            'effect_ms': sum(times) / len(times) if len(times) > 0 else 0.0,
+            'dropped_particles': self.dropped_particles,
+            'merged_effects': self.merged_effects,
+        }
+
 class EffectManager:
-    def __init__(self) -> None:
+    def __init__(self, rng: np.random.RandomState = None, governor: QualityGovernor = None) -> None:
         self.effects: typing.List[Effect] = []
+        self.rng = rng if rng is not None else np.random
+        self.governor = governor
+
+    def update(self) -> None:
+        alive = []
+        for effect in self.effects:
+            if self.governor is not None: effect.spawn_scale = self.governor.spawn_scale()
+            effect.update()
+            if effect.is_finished(): particle_pool.release(effect.particles)
+            else: alive.append(effect)
+        self.effects = alive
+        if self.governor is not None: self.enforce_cap(self.governor.max_particles())
+
+    def enforce_cap(self, cap: int) -> None:
+        total = sum(len(effect.particles) for effect in self.effects)
+        if total <= cap: return
+        # Every effect gives up the same share of its oldest particles
+        ratio = cap / total
+        for effect in self.effects:
+            count = len(effect.particles)
+            keep = int(math.ceil(count * ratio))
+            if keep < count:
+                effect.particles.keep(np.arange(count) >= count - keep)
+                self.governor.dropped_particles += count - keep
+
+    def render(self, screen: pygame.Surface, steps: int) -> typing.List[pygame.Rect]:
+        start = time.perf_counter()
+        for _ in range(steps):
+            self.update()
+        rects = self.draw(screen)
+        if self.governor is not None: self.governor.record((time.perf_counter() - start) * 1000)
+        return rects
 
-    def draw(self, screen: pygame.Surface) -> None:
+    def draw(self, screen: pygame.Surface) -> typing.List[pygame.Rect]:
+        rects = []
         for effect in self.effects:
-            if effect.is_finished(): self.effects.remove(effect)
-            else: effect.draw(screen)
+            rects.extend(effect.draw(screen))
+        return rects
 
     def add_effect(self, effect: 'Effect') -> None:
+        if self.governor is not None and self.governor.merge():
+            for other in self.effects:
+                if type(other) is type(effect) and abs(other.x - effect.x) <= QualityGovernor.MERGE_RADIUS and abs(other.y - effect.y) <= QualityGovernor.MERGE_RADIUS:
+                    # Keep the nearby effect going instead of starting another one on top of it
+                    other.live_time = max(other.live_time, effect.live_time)
+                    self.governor.merged_effects += 1
+                    self.governor.dropped_particles += len(effect.particles)
+                    particle_pool.release(effect.particles)
+                    return
         self.effects.append(effect)
 
+    def take_effects(self) -> typing.List['Effect']:
+        effects, self.effects = self.effects, []
+        return effects
+
+    def clear(self) -> None:
+        for effect in self.effects:
+            particle_pool.release(effect.particles)
+        self.effects = []
+
+    def save_effects(self) -> typing.List[tuple]:
+        return [effect.save_state() for effect in self.effects]
+
+    def load_effects(self, states: typing.List[tuple], rng: np.random.RandomState) -> None:
+        self.clear()
+        self.effects = [Effect.from_state(state, rng) for state in states]
+
+class ParticleBuffer:
+    FIELDS = ('x', 'y', 'vx', 'vy', 'scale', 'alpha', 'ttl')
+    def __init__(self, extra: typing.Tuple[str, ...] = (), capacity: int = 32) -> None:
+        self.names = ParticleBuffer.FIELDS + tuple(extra)
+        self.count = 0
+        self.data = {name: np.zeros(capacity, dtype=np.float64) for name in self.names}
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.data[name][:self.count]
+
+    def __setitem__(self, name: str, value) -> None:
+        self.data[name][:self.count] = value
+
+    def append(self, n: int, **values) -> None:
+        if n == 0: return
+        capacity = len(self.data['x'])
+        if self.count + n > capacity:
+            while capacity < self.count + n: capacity *= 2
+            for name, array in self.data.items():
+                grown = np.zeros(capacity, dtype=array.dtype)
+                grown[:self.count] = array[:self.count]
+                self.data[name] = grown
+        start, end = self.count, self.count + n
+        for name, array in self.data.items():
+            array[start:end] = values.get(name, 0)
+        self.count = end
+
+    def keep(self, alive: np.ndarray) -> None:
+        n = int(np.count_nonzero(alive))
+        if n == self.count: return
+        for array in self.data.values():
+            array[:n] = array[:self.count][alive]
+        self.count = n
+
+class ParticlePool:
+    def __init__(self, max_free: int = 64) -> None:
+        self.max_free = max_free
+        self.free: typing.Dict[typing.Tuple[str, ...], typing.List[ParticleBuffer]] = {}
+        self.stats = PoolStats()
+        # Effects are created by the simulation and may be finished by the render thread
+        self.lock = threading.Lock()
+
+    def acquire(self, extra: typing.Tuple[str, ...]) -> ParticleBuffer:
+        with self.lock:
+            free = self.free.get(extra)
+            self.stats.acquire(1, bool(free))
+            if free: return free.pop()
+        return ParticleBuffer(extra)
+
+    def release(self, buffer: ParticleBuffer) -> None:
+        buffer.count = 0
+        with self.lock:
+            self.stats.release(1)
+            free = self.free.setdefault(buffer.names[len(ParticleBuffer.FIELDS):], [])
+            if len(free) < self.max_free: free.append(buffer)
+
+particle_pool = ParticlePool()
+
+class SpriteVariantCache:
+    def __init__(self, name: str, scale_step: float = 0.01, alpha_step: int = 16, max_size: int = 512) -> None:
+        self.name = name
+        self.scale_step = scale_step
+        self.alpha_step = alpha_step
+        self.max_size = max_size
+        self.variants: typing.OrderedDict[typing.Tuple[int, int], pygame.Surface] = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, scale_k: float, alpha: float = 255) -> pygame.Surface:
+        key = (round(scale_k / self.scale_step), round(alpha / self.alpha_step))
+        variant = self.variants.get(key)
+        if variant is not None:
+            self.hits += 1
+            self.variants.move_to_end(key)
+            return variant
+        self.misses += 1
+        variant = utils.scale(assets.image(self.name), key[0] * self.scale_step)
+        variant.set_alpha(min(255, key[1] * self.alpha_step))
+        self.variants[key] = variant
+        if len(self.variants) > self.max_size:
+            self.variants.popitem(last=False)
+        return variant
+
 class Effect(ABC):
-    def __init__(self, live_time: int) -> None:
-        self.particles = []
+    EXTRA_FIELDS: typing.Tuple[str, ...] = ()
+    def __init__(self, live_time: int, rng: np.random.RandomState = None) -> None:
+        self.particles = particle_pool.acquire(self.EXTRA_FIELDS)
         self.live_time = live_time
+        self.rng = rng if rng is not None else np.random
+        self.spawn_scale = 1.0
+        self.spawn_credit = 0.0
 
-    def draw(self, screen: pygame.surface.Surface) -> None:
+    def update(self) -> None:
         self.live_time -= 1
         if self.live_time > 0:
-            self.spawn_particles()
-        for particle in self.particles:
-            self.update_particle(particle)
-            self.draw_particle(screen, particle)
-            self.delete_particle(particle)
-    
+            # At reduced quality only every n-th spawn tick emits particles
+            self.spawn_credit += self.spawn_scale
+            if self.spawn_credit >= 1:
+                self.spawn_credit -= 1
+                self.spawn_particles()
+        if len(self.particles) == 0: return
+        self.update_particles(self.particles)
+        self.particles.keep(self.alive_particles(self.particles))
+
+    def draw(self, screen: pygame.surface.Surface) -> typing.List[pygame.Rect]:
+        if len(self.particles) == 0: return []
+        return self.draw_particles(screen, self.particles)
+
+    def save_state(self) -> tuple:
+        attrs = {name: value for name, value in self.__dict__.items() if name not in ('particles', 'rng')}
+        return type(self), attrs, {name: self.particles[name].copy() for name in self.particles.names}
+
+    @staticmethod
+    def from_state(state: tuple, rng: np.random.RandomState) -> 'Effect':
+        effect_type, attrs, particles = state
+        effect = effect_type.__new__(effect_type)
+        effect.__dict__.update(attrs)
+        effect.rng = rng
+        effect.particles = particle_pool.acquire(effect_type.EXTRA_FIELDS)
+        effect.particles.append(len(particles['x']), **particles)
+        return effect
+
     @abstractmethod
     def spawn_particles(self):
         pass
 
     @abstractmethod
-    def update_particle(self, particle):
+    def update_particles(self, particles: ParticleBuffer) -> None:
         pass
 
     @abstractmethod
-    def draw_particle(self, screen: pygame.surface.Surface, particle) -> None:
+    def draw_particles(self, screen: pygame.surface.Surface, particles: ParticleBuffer) -> typing.List[pygame.Rect]:
         pass
-    
+
     @abstractmethod
-    def delete_particle(self, particle) -> None:
+    def alive_particles(self, particles: ParticleBuffer) -> np.ndarray:
         pass
 
     def is_finished(self) -> bool:
         return len(self.particles) == 0
-    
+
 class FireworkEffect(Effect):
-    def __init__(self, live_time: int, x: int, y: int) -> None:
-        super().__init__(live_time)
+    def __init__(self, live_time: int, x: int, y: int, rng: np.random.RandomState = None) -> None:
+        super().__init__(live_time, rng)
         self.x = x
         self.y = y
         self.spawn_particles()
 
     def spawn_particles(self):
-        self.particles.append([[self.x, self.y], [random.randint(0, 20) / 10 - 1, -2], random.randint(4, 6)])
-    
-    def update_particle(self, particle):
-        particle[0][0] += particle[1][0]
-        particle[0][1] += particle[1][1]
-        particle[2] -= 0.1
-        particle[1][1] += 0.1
+        self.particles.append(1, x=self.x, y=self.y, vx=self.rng.randint(0, 21) / 10 - 1, vy=-2, scale=self.rng.randint(4, 7))
 
-    def draw_particle(self, screen: pygame.surface.Surface, particle) -> None:
-        pygame.draw.circle(screen, (255, 255, 255), [int(particle[0][0]), int(particle[0][1])], int(particle[2]))
+    def update_particles(self, particles: ParticleBuffer) -> None:
+        particles['x'] += particles['vx']
+        particles['y'] += particles['vy']
+        particles['scale'] -= 0.1
+        particles['vy'] += 0.1
 
-    def delete_particle(self, particle) -> None:
-        if particle[2] <= 0:
-            self.particles.remove(particle)
+    def draw_particles(self, screen: pygame.surface.Surface, particles: ParticleBuffer) -> typing.List[pygame.Rect]:
+        return [pygame.draw.circle(screen, (255, 255, 255), (x, y), radius) for x, y, radius in zip(particles['x'].astype(int).tolist(), particles['y'].astype(int).tolist(), particles['scale'].astype(int).tolist())]
+
+    def alive_particles(self, particles: ParticleBuffer) -> np.ndarray:
+        return particles['scale'] > 0
 
 class SmokeUpEffect(Effect):
-    class SmokeParticle:
-        IMAGE = pygame.image.load('assets/smoke.png')
-        def __init__(self, x=0, y=0) -> None:
-            self.x = x
-            self.y = y
-            self.scale_k = 0.1
-            self.img = utils.scale(SmokeUpEffect.SmokeParticle.IMAGE, self.scale_k)
-            self.alpha = 255
-            self.alpha_rate = 3
-            self.alive = True
-            self.vx = 0
-            self.vy = (4 + random.randint(7, 10) / 10) * -1
-            self.k = 0.04 * random.random() * random.choice([-1, 1])
-
-    def __init__(self, live_time: int, x: int, y: int) -> None:
-        super().__init__(live_time)
-        self.particles: typing.List[SmokeUpEffect.SmokeParticle] = []
+    SPRITES = SpriteVariantCache('smoke.png')
+    EXTRA_FIELDS = ('k', 'alpha_rate')
+
+    def __init__(self, live_time: int, x: int, y: int, rng: np.random.RandomState = None) -> None:
+        super().__init__(live_time, rng)
         self.x = x
         self.y = y
         self.spawn_particles()
 
     def spawn_particles(self):
-        self.particles.append(SmokeUpEffect.SmokeParticle(self.x, self.y))
-    
-    def update_particle(self, particle: SmokeParticle):
-        particle.x += particle.vx
-        particle.vx += particle.k
-        particle.y -= particle.vy
-        particle.vy *= 0.99
-        particle.scale_k += 0.005
-        particle.alpha -= particle.alpha_rate
-        if particle.alpha < 0:
-            particle.alpha = 0
-            particle.alive = False
-        particle.alpha_rate -= 0.1
-        if particle.alpha_rate < 1.5:
-            particle.alpha_rate = 1.5
-        particle.img = utils.scale(SmokeUpEffect.SmokeParticle.IMAGE, particle.scale_k)
-        particle.img.set_alpha(particle.alpha)
-        
-
-    def draw_particle(self, screen: pygame.surface.Surface, particle: SmokeParticle) -> None:
-        screen.blit(particle.img, particle.img.get_rect(center=(particle.x, particle.y)))
-
-    def delete_particle(self, particle: SmokeParticle) -> None:
-        if not particle.alive:
-            self.particles.remove(particle)
+        self.particles.append(1, x=self.x, y=self.y, vy=(4 + self.rng.randint(7, 11) / 10) * -1, scale=0.1, alpha=255,
+                              k=0.04 * self.rng.random_sample() * self.rng.choice([-1, 1]), alpha_rate=3)
+
+    def update_particles(self, particles: ParticleBuffer) -> None:
+        particles['x'] += particles['vx']
+        particles['vx'] += particles['k']
+        particles['y'] -= particles['vy']
+        particles['vy'] *= 0.99
+        particles['scale'] += 0.005
+        particles['alpha'] = np.maximum(particles['alpha'] - particles['alpha_rate'], 0)
+        particles['alpha_rate'] = np.maximum(particles['alpha_rate'] - 0.1, 1.5)
+
+    def draw_particles(self, screen: pygame.surface.Surface, particles: ParticleBuffer) -> typing.List[pygame.Rect]:
+        sequence = []
+        for x, y, scale_k, alpha in zip(particles['x'].tolist(), particles['y'].tolist(), particles['scale'].tolist(), particles['alpha'].tolist()):
+            img = SmokeUpEffect.SPRITES.get(scale_k, alpha)
+            sequence.append((img, img.get_rect(center=(x, y))))
+        return screen.blits(sequence)
+
+    def alive_particles(self, particles: ParticleBuffer) -> np.ndarray:
+        return particles['alpha'] > 0
 
 class SmokeCircleEffect(Effect):
-    class SmokeParticle:
-        IMAGE = pygame.image.load('assets/smoke.png')
-        def __init__(self, x: int, y: int, radian: float, radius: int) -> None:
-            self.radian = random.uniform(radian - 0.3, radian + 0.3)
-            dx = int(radius * math.cos(self.radian))
-            dy = -1 * int(radius * math.sin(self.radian))
-            self.x = x + dx
-            self.y = y + dy
-            self.v = 0
-            self.a = 0.1
-            self.alpha = 180
-            self.alpha_a = 6
-            self.img = utils.scale(SmokeCircleEffect.SmokeParticle.IMAGE, random.uniform(0.15, 0.25))
-
-    def __init__(self, live_time: int, x: int, y:int, radius: int) -> None:
-        super().__init__(live_time)
+    SPRITES = SmokeUpEffect.SPRITES
+    EXTRA_FIELDS = ('radian', 'speed', 'accel')
+
+    def __init__(self, live_time: int, x: int, y:int, radius: int, rng: np.random.RandomState = None) -> None:
+        super().__init__(live_time, rng)
         self.radius = radius
         self.x = x
         self.y = y
@@ -146,58 +347,45 @@ class SmokeCircleEffect(Effect):
         self.spawn_particles()
 
     def spawn_particles(self):
-        for i in range(self.num_of_particals):
-            self.particles.append(SmokeCircleEffect.SmokeParticle(self.x, self.y, i * 360/self.num_of_particals * math.pi / 180, self.radius))
+        n = self.num_of_particals
+        base = np.arange(n) * 360 / n * math.pi / 180
+        radian = self.rng.uniform(base - 0.3, base + 0.3)
+        self.particles.append(n, x=self.x + (self.radius * np.cos(radian)).astype(int), y=self.y - (self.radius * np.sin(radian)).astype(int),
+                              scale=self.rng.uniform(0.15, 0.25, n), alpha=180, radian=radian, accel=0.1)
 
-    def update_particle(self, particle: SmokeParticle):
-        particle.x += (particle.v * math.cos(particle.radian))
-        particle.y += (particle.v * math.sin(particle.radian) * -1)
-        particle.v += particle.a
-        particle.alpha -= particle.alpha_a
-        particle.img.set_alpha(particle.alpha if particle.alpha > 0 else 0)
+    def update_particles(self, particles: ParticleBuffer) -> None:
+        radian = particles['radian']
+        particles['x'] += particles['speed'] * np.cos(radian)
+        particles['y'] -= particles['speed'] * np.sin(radian)
+        particles['speed'] += particles['accel']
+        particles['alpha'] -= 6
 
-    def draw_particle(self, screen: pygame.surface.Surface, particle: SmokeParticle) -> None:
-        screen.blit(particle.img, (particle.x, particle.y))
+    def draw_particles(self, screen: pygame.surface.Surface, particles: ParticleBuffer) -> typing.List[pygame.Rect]:
+        return screen.blits([(SmokeCircleEffect.SPRITES.get(scale_k, alpha), (x, y)) for x, y, scale_k, alpha in zip(particles['x'].tolist(), particles['y'].tolist(), particles['scale'].tolist(), np.maximum(particles['alpha'], 0).tolist())])
 
-    def delete_particle(self, particle: SmokeParticle) -> None:
-        if particle.alpha <= 0:
-            self.particles.remove(particle)
+    def alive_particles(self, particles: ParticleBuffer) -> np.ndarray:
+        return particles['alpha'] > 0
 
 class SparkleEffect(Effect):
     COLOR_LIST = [(102,0,102), (153,0,153), (204,0,204), (255,0,255), (255,51,255), (255,102,155), (255,204,255)]
-    class SparkleParticle:
-        def __init__(self, x: int, y: int) -> None:
-            self.x = x + random.randint(-20, 20)
-            self.y = y + random.randint(-20, 20)
-            self.edge = random.randint(3, 7)
-            self.live_time = 3
-            color_index = random.randint(0, 4)
-            self.color = SparkleEffect.COLOR_LIST[color_index]
-        def draw(self, screen: pygame.Surface) -> None:
-            pygame.draw.polygon(screen, self.color, [
-                (self.x, self.y), 
-                (self.x + self.edge, self.y), 
-                (self.x + self.edge, self.y + self.edge), 
-                (self.x, self.y + self.edge)
-            ])
-        def update(self) -> None:
-            self.live_time -= 1
-
-    def __init__(self, live_time: int, x: int, y: int) -> None:
-        super().__init__(live_time)
+    EXTRA_FIELDS = ('color',)
+
+    def __init__(self, live_time: int, x: int, y: int, rng: np.random.RandomState = None) -> None:
+        super().__init__(live_time, rng)
         self.x = x
         self.y = y
         self.spawn_particles()
 
     def spawn_particles(self):
-        self.particles.append(SparkleEffect.SparkleParticle(self.x, self.y))
+        self.particles.append(1, x=self.x + self.rng.randint(-20, 21), y=self.y + self.rng.randint(-20, 21),
+                              scale=self.rng.randint(3, 8), ttl=3, color=self.rng.randint(0, 5))
+
+    def update_particles(self, particles: ParticleBuffer) -> None:
+        particles['ttl'] -= 1
 
-    def draw_particle(self, screen: pygame.surface.Surface, particle: SparkleParticle) -> None:
-        particle.draw(screen)
+    def draw_particles(self, screen: pygame.surface.Surface, particles: ParticleBuffer) -> typing.List[pygame.Rect]:
+        colors = SparkleEffect.COLOR_LIST
+        return [screen.fill(colors[color], (x, y, edge + 1, edge + 1)) for x, y, edge, color in zip(particles['x'].astype(int).tolist(), particles['y'].astype(int).tolist(), particles['scale'].astype(int).tolist(), particles['color'].astype(int).tolist())]
 
-    def delete_particle(self, particle: SparkleParticle) -> None:
-        if particle.live_time <= 0:
-            self.particles.remove(particle)
-    
-    def update_particle(self, particle: SparkleParticle):
-        particle.update()
+    def alive_particles(self, particles: ParticleBuffer) -> np.ndarray:
+        return particles['ttl'] > 0
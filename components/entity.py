@@ -0,0 +1,174 @@
+import typing
+import numpy as np
+import pygame
+from components.assets import assets
+from components.pool import PoolStats
+
+class SpriteType:
+    def __init__(self, type_id: int, name: str, size: typing.Tuple[int, int]) -> None:
+        self.type_id = type_id
+        self.name = name
+        self.size = tuple(size)
+        self.width, self.height = self.size
+
+    @property
+    def image(self) -> pygame.Surface:
+        return assets.image(self.name, self.size)
+
+    @property
+    def mask(self) -> pygame.mask.Mask:
+        return assets.mask(self.name, self.size)
+
+class SpriteRegistry:
+    def __init__(self) -> None:
+        self.types: typing.List[SpriteType] = []
+        self.ids: typing.Dict[typing.Tuple[str, typing.Tuple[int, int]], int] = {}
+        self.sizes = np.zeros((0, 2), dtype=np.int32)
+
+    def register(self, name: str, size: typing.Tuple[int, int]) -> int:
+        key = (name, tuple(size))
+        if key in self.ids: return self.ids[key]
+        sprite = SpriteType(len(self.types), name, size)
+        self.ids[key] = sprite.type_id
+        self.types.append(sprite)
+        self.sizes = np.vstack([self.sizes, [[sprite.width, sprite.height]]]).astype(np.int32)
+        return sprite.type_id
+
+    def get(self, type_id: int) -> SpriteType:
+        return self.types[type_id]
+
+    def load(self) -> None:
+        # Building a mask locks its surface, which makes a blit of it on another thread fail, so a render thread
+        # needs every image and mask to exist before it starts
+        for sprite in self.types:
+            sprite.image
+            sprite.mask
+
+sprite_registry = SpriteRegistry()
+
+class EntityStore:
+    def __init__(self, registry: SpriteRegistry = sprite_registry, capacity: int = 64) -> None:
+        self.registry = registry
+        self.count = 0
+        self.pos = np.zeros((capacity, 2), dtype=np.float64)
+        self.vel = np.zeros((capacity, 2), dtype=np.float64)
+        self.health = np.zeros(capacity, dtype=np.int32)
+        self.cool_down = np.zeros(capacity, dtype=np.int32)
+        self.type_id = np.zeros(capacity, dtype=np.int32)
+        self.stats = PoolStats()
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def x(self) -> np.ndarray:
+        return self.pos[:self.count, 0]
+
+    @property
+    def y(self) -> np.ndarray:
+        return self.pos[:self.count, 1]
+
+    def capacity(self) -> int:
+        return len(self.type_id)
+
+    def _grow(self, needed: int) -> None:
+        capacity = self.capacity()
+        if needed <= capacity: return
+        while capacity < needed: capacity *= 2
+        for name in ('pos', 'vel', 'health', 'cool_down', 'type_id'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def spawn(self, x: float, y: float, vx: float, vy: float, type_id: int, health: int = 0) -> int:
+        self.stats.acquire(1, self.count < self.capacity())
+        self._grow(self.count + 1)
+        index = self.count
+        self.pos[index] = (x, y)
+        self.vel[index] = (vx, vy)
+        self.health[index] = health
+        self.cool_down[index] = 0
+        self.type_id[index] = type_id
+        self.count += 1
+        return index
+
+    def spawn_many(self, xs: np.ndarray, ys: np.ndarray, vx: float, vy: float, type_ids: np.ndarray, health: int = 0, cool_down: typing.Union[int, np.ndarray] = 0) -> None:
+        n = len(xs)
+        if n == 0: return
+        self.stats.acquire(n, self.count + n <= self.capacity())
+        self._grow(self.count + n)
+        start, end = self.count, self.count + n
+        self.pos[start:end, 0] = xs
+        self.pos[start:end, 1] = ys
+        self.vel[start:end] = (vx, vy)
+        self.health[start:end] = health
+        self.cool_down[start:end] = cool_down
+        self.type_id[start:end] = type_ids
+        self.count = end
+
+    def step(self) -> None:
+        self.pos[:self.count] += self.vel[:self.count]
+
+    def keep(self, alive: np.ndarray) -> None:
+        n = int(np.count_nonzero(alive))
+        if n == self.count: return
+        for name in ('pos', 'vel', 'health', 'cool_down', 'type_id'):
+            array = getattr(self, name)
+            array[:n] = array[:self.count][alive]
+        self.stats.release(self.count - n)
+        self.count = n
+
+    def clear(self) -> None:
+        self.stats.release(self.count)
+        self.count = 0
+
+    def save_state(self) -> typing.Tuple[np.ndarray, ...]:
+        return tuple(getattr(self, name)[:self.count].copy() for name in ('pos', 'vel', 'health', 'cool_down', 'type_id'))
+
+    def load_state(self, state: typing.Tuple[np.ndarray, ...]) -> None:
+        n = len(state[0])
+        self.clear()
+        self.stats.acquire(n, n <= self.capacity())
+        self._grow(n)
+        for name, array in zip(('pos', 'vel', 'health', 'cool_down', 'type_id'), state):
+            getattr(self, name)[:n] = array
+        self.count = n
+
+    def sizes(self) -> np.ndarray:
+        return self.registry.sizes[self.type_id[:self.count]]
+
+    def overlapping(self, x: float, y: float, width: int, height: int) -> np.ndarray:
+        sizes = self.sizes()
+        pos = self.pos[:self.count]
+        hit = (pos[:, 0] < x + width) & (pos[:, 0] + sizes[:, 0] > x) & (pos[:, 1] < y + height) & (pos[:, 1] + sizes[:, 1] > y)
+        return np.flatnonzero(hit)
+
+    def sprite(self, index: int) -> SpriteType:
+        return self.registry.types[self.type_id[index]]
+
+    def frame(self, alpha: float = 0.0) -> 'EntityFrame':
+        # alpha extrapolates along the velocity by a fraction of a tick
+        pos = self.pos[:self.count] + self.vel[:self.count] * alpha if alpha > 0 else self.pos[:self.count]
+        return EntityFrame(self.registry, self.type_id[:self.count].tolist(), pos[:, 0].tolist(), pos[:, 1].tolist())
+
+    def draw(self, surface: pygame.Surface, alpha: float = 0.0) -> typing.List[pygame.Rect]:
+        return self.frame(alpha).draw(surface)
+
+class EntityFrame:
+    # Detached copy of what an EntityStore looks like at one moment, safe to draw from another thread
+    def __init__(self, registry: SpriteRegistry, type_ids: typing.List[int], xs: typing.List[float], ys: typing.List[float]) -> None:
+        self.registry = registry
+        self.type_ids = type_ids
+        self.xs = xs
+        self.ys = ys
+
+    def __len__(self) -> int:
+        return len(self.type_ids)
+
+    def blit_sequence(self) -> typing.List[typing.Tuple[pygame.Surface, typing.Tuple[float, float]]]:
+        types = self.registry.types
+        return [(types[type_id].image, (x, y)) for type_id, x, y in zip(self.type_ids, self.xs, self.ys)]
+
+    def draw(self, surface: pygame.Surface) -> typing.List[pygame.Rect]:
+        return surface.blits(self.blit_sequence())
@@ -0,0 +1,141 @@
+import typing
+import numpy as np
+import pygame
+from components.simulation import init_headless
+from components.scene import SceneManager, GameScene
+from components.input import RECORDED_KEYS, decode_keys, KeyState
+from components.entity import EntityStore
+from components.observation import FrameBuffer, pixels
+
+# An action is a bitmask over RECORDED_KEYS, the same encoding the replay logs use
+NUM_ACTIONS = 1 << len(RECORDED_KEYS)
+
+class ActionInput:
+    def __init__(self) -> None:
+        self.keys = decode_keys(0)
+    def set_action(self, action: int) -> None:
+        self.keys = decode_keys(int(action))
+    def get_pressed(self) -> KeyState:
+        return self.keys
+    def close(self) -> None:
+        pass
+
+class GameEnv:
+    def __init__(self, seed: int = 0, max_enemies: int = 32, max_bullets: int = 64, frame_size: typing.Tuple[int, int] = None, grayscale: bool = False, frame_stack: int = 1, frame_skip: int = 1, max_steps: int = None, damage_penalty: float = 1.0, seed_stride: int = 1) -> None:
+        init_headless()
+        self.seed = seed
+        self.seed_stride = seed_stride
+        self.max_enemies = max_enemies
+        self.max_bullets = max_bullets
+        self.frame_size = frame_size
+        self.frame_skip = frame_skip
+        self.max_steps = max_steps
+        self.damage_penalty = damage_penalty
+        self.input_source = ActionInput()
+        self.screen: pygame.Surface = None
+        self.frames = FrameBuffer((GameScene.WINDOW_WIDTH, GameScene.WINDOW_HEIGHT), frame_size, grayscale, frame_stack) if frame_size is not None else None
+        self.scene_manager: SceneManager = None
+        self.scene: GameScene = None
+        self.steps = 0
+
+    def reset(self, seed: int = None) -> typing.Dict[str, np.ndarray]:
+        if seed is not None: self.seed = seed
+        if self.scene_manager is not None: self.scene_manager.clear()
+        self.scene_manager = SceneManager()
+        self.scene = GameScene(self.scene_manager, self.input_source, self.seed)
+        self.scene.queue_effects = self.frames is not None
+        self.scene_manager.push(self.scene)
+        self.steps = 0
+        if self.frames is not None: self.frames.reset()
+        # Next reset without an explicit seed starts a different episode
+        self.seed += self.seed_stride
+        return self.observe()
+
+    def vitality(self) -> int:
+        player = self.scene.player
+        return (player.lives - 1) * GameScene.Player.MAX_HEALTH + player.health
+
+    def step(self, action: int) -> typing.Tuple[typing.Dict[str, np.ndarray], float, bool, dict]:
+        self.input_source.set_action(action)
+        player = self.scene.player
+        score, vitality = player.score, self.vitality()
+        for _ in range(self.frame_skip):
+            self.scene_manager.handle_events([])
+            self.scene_manager.update()
+            self.steps += 1
+            if not self.scene.is_running: break
+        reward = (player.score - score) - self.damage_penalty * (vitality - self.vitality())
+        truncated = self.max_steps is not None and self.steps >= self.max_steps
+        done = not self.scene.is_running or truncated
+        info = {'score': player.score, 'lives': player.lives, 'level': self.scene.level, 'steps': self.steps, 'truncated': truncated and self.scene.is_running}
+        return self.observe(), float(reward), done, info
+
+    def _positions(self, store: EntityStore, limit: int, with_health: bool) -> np.ndarray:
+        count = min(len(store), limit)
+        out = np.zeros((limit, 3 if with_health else 2), dtype=np.float32)
+        out[:count, :2] = store.pos[:count]
+        if with_health: out[:count, 2] = store.health[:count]
+        return out
+
+    def observe(self) -> typing.Dict[str, np.ndarray]:
+        player = self.scene.player
+        observation = {
+            'player': np.array((player.x, player.y, player.health, player.lives), dtype=np.float32),
+            'enemies': self._positions(self.scene.enemies, self.max_enemies, True),
+            'enemy_bullets': self._positions(self.scene.enemy_bullets, self.max_bullets, False),
+            'player_bullets': self._positions(player.bullets, self.max_bullets, False),
+            'counts': np.array((len(self.scene.enemies), len(self.scene.enemy_bullets), len(player.bullets)), dtype=np.int32),
+        }
+        if self.frames is not None:
+            self.frames.capture(self.render())
+            observation['frame'] = self.frames.stacked()
+        return observation
+
+    def render(self) -> pygame.Surface:
+        if self.screen is None: self.screen = pygame.Surface((GameScene.WINDOW_WIDTH, GameScene.WINDOW_HEIGHT))
+        self.scene_manager.draw(self.screen)
+        return self.screen
+
+    def frame_view(self):
+        # Zero-copy (height, width, 3) view of the last rendered frame, see observation.pixels
+        if self.screen is None: self.render()
+        return pixels(self.screen)
+
+    def memory_bytes(self) -> int:
+        total = self.screen.get_pitch() * self.screen.get_height() if self.screen is not None else 0
+        if self.frames is not None: total += self.frames.nbytes()
+        return total
+
+    def close(self) -> None:
+        if self.scene_manager is not None: self.scene_manager.clear()
+
+class VectorEnv:
+    def __init__(self, num_envs: int, seed: int = 0, **kwargs) -> None:
+        # Environment i plays seeds seed + i, seed + i + num_envs, ... so episodes never repeat across environments
+        self.envs = [GameEnv(seed=seed + index, seed_stride=num_envs, **kwargs) for index in range(num_envs)]
+        self.num_envs = num_envs
+
+    @staticmethod
+    def _stack(observations: typing.List[typing.Dict[str, np.ndarray]]) -> typing.Dict[str, np.ndarray]:
+        return {name: np.stack([observation[name] for observation in observations]) for name in observations[0]}
+
+    def reset(self) -> typing.Dict[str, np.ndarray]:
+        return VectorEnv._stack([env.reset() for env in self.envs])
+
+    def step(self, actions: typing.Sequence[int]) -> typing.Tuple[typing.Dict[str, np.ndarray], np.ndarray, np.ndarray, typing.List[dict]]:
+        observations = []
+        rewards = np.zeros(self.num_envs, dtype=np.float32)
+        dones = np.zeros(self.num_envs, dtype=bool)
+        infos = []
+        for index, env in enumerate(self.envs):
+            observation, rewards[index], dones[index], info = env.step(actions[index])
+            if dones[index]:
+                # Finished environments restart immediately; the last observation of the episode goes in info
+                info['final_observation'] = observation
+                observation = env.reset()
+            observations.append(observation)
+            infos.append(info)
+        return VectorEnv._stack(observations), rewards, dones, infos
+
+    def close(self) -> None:
+        for env in self.envs: env.close()
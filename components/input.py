@@ -0,0 +1,130 @@
+import typing
+import random
+import struct
+import pygame
+
+RECORDED_KEYS = (pygame.K_LEFT, pygame.K_RIGHT, pygame.K_UP, pygame.K_DOWN, pygame.K_SPACE)
+
+class KeyState:
+    def __init__(self, keys: typing.Iterable[int] = ()) -> None:
+        self.keys = frozenset(keys)
+    def __getitem__(self, key: int) -> bool:
+        return key in self.keys
+
+def encode_keys(keys: typing.Sequence[bool]) -> int:
+    mask = 0
+    for bit, key in enumerate(RECORDED_KEYS):
+        if keys[key]: mask |= 1 << bit
+    return mask
+
+def decode_keys(mask: int) -> KeyState:
+    return KeyState(key for bit, key in enumerate(RECORDED_KEYS) if mask & (1 << bit))
+
+class ReplayLog:
+    MAGIC = b'SSR1'
+    HEADER = struct.Struct('<4sQI')
+    RUN = struct.Struct('<BH')
+
+    def __init__(self, seed: int, masks: bytearray = None) -> None:
+        self.seed = seed
+        self.masks = masks if masks is not None else bytearray()
+
+    def __len__(self) -> int:
+        return len(self.masks)
+
+    def to_bytes(self) -> bytes:
+        runs = bytearray()
+        index = 0
+        while index < len(self.masks):
+            mask, run = self.masks[index], 1
+            while index + run < len(self.masks) and self.masks[index + run] == mask and run < 0xFFFF:
+                run += 1
+            runs += ReplayLog.RUN.pack(mask, run)
+            index += run
+        return ReplayLog.HEADER.pack(ReplayLog.MAGIC, self.seed, len(self.masks)) + bytes(runs)
+
+    @staticmethod
+    def from_bytes(data: bytes) -> 'ReplayLog':
+        magic, seed, ticks = ReplayLog.HEADER.unpack_from(data)
+        if magic != ReplayLog.MAGIC:
+            raise ValueError('not a replay log')
+        masks = bytearray()
+        for mask, run in ReplayLog.RUN.iter_unpack(data[ReplayLog.HEADER.size:]):
+            masks += bytes((mask,)) * run
+        if len(masks) != ticks:
+            raise ValueError(f'replay log is truncated: expected {ticks} ticks, got {len(masks)}')
+        return ReplayLog(seed, masks)
+
+    def save(self, path: str) -> None:
+        with open(path, 'wb') as file:
+            file.write(self.to_bytes())
+
+    @staticmethod
+    def load(path: str) -> 'ReplayLog':
+        with open(path, 'rb') as file:
+            return ReplayLog.from_bytes(file.read())
+
+class KeyboardInput:
+    def get_pressed(self) -> typing.Sequence[bool]:
+        return pygame.key.get_pressed()
+    def close(self) -> None:
+        pass
+
+class ScriptedInput:
+    def __init__(self, policy: typing.Callable[[int], typing.Iterable[int]]) -> None:
+        self.policy = policy
+        self.tick = 0
+    def get_pressed(self) -> KeyState:
+        state = KeyState(self.policy(self.tick))
+        self.tick += 1
+        return state
+    def close(self) -> None:
+        pass
+
+class InputRecorder:
+    def __init__(self, source, seed: int, path: str = None) -> None:
+        self.source = source
+        self.path = path
+        self.log = ReplayLog(seed)
+    def get_pressed(self) -> KeyState:
+        mask = encode_keys(self.source.get_pressed())
+        self.log.masks.append(mask)
+        return decode_keys(mask)
+    def close(self) -> None:
+        self.source.close()
+        if self.path is not None: self.log.save(self.path)
+
+class ReplayInput:
+    def __init__(self, log: ReplayLog) -> None:
+        self.log = log
+        self.tick = 0
+    def get_pressed(self) -> KeyState:
+        mask = self.log.masks[self.tick] if self.tick < len(self.log) else 0
+        self.tick += 1
+        return decode_keys(mask)
+    def is_finished(self) -> bool:
+        return self.tick >= len(self.log)
+    def close(self) -> None:
+        pass
+
+def idle_policy(_: int) -> typing.Iterable[int]:
+    return ()
+
+def sweep_policy(tick: int) -> typing.Iterable[int]:
+    return (pygame.K_LEFT if (tick // 100) % 2 == 0 else pygame.K_RIGHT, pygame.K_SPACE)
+
+def random_policy(seed: int = 0, hold: int = 10) -> typing.Callable[[int], typing.Iterable[int]]:
+    rng = random.Random(seed)
+    moves = [(), (pygame.K_LEFT,), (pygame.K_RIGHT,), (pygame.K_UP,), (pygame.K_DOWN,)]
+    current = [()]
+    def policy(tick: int) -> typing.Iterable[int]:
+        if tick % hold == 0:
+            current[0] = rng.choice(moves) + ((pygame.K_SPACE,) if rng.random() < 0.7 else ())
+        return current[0]
+    return policy
+
+POLICIES = {
+    'idle': lambda _: idle_policy,
+    'sweep': lambda _: sweep_policy,
+    'random': random_policy,
+}
@@ -0,0 +1,85 @@
+import typing
+import contextlib
+import numpy as np
+import pygame
+
+GRAY_WEIGHTS = (0.299, 0.587, 0.114)
+
+@contextlib.contextmanager
+def pixels(surface: pygame.Surface) -> typing.Iterator[np.ndarray]:
+    # A (height, width, 3) view straight into the surface memory. The surface stays locked while any view
+    # into it is alive, so do not keep the array past the block or blits onto the surface will fail
+    view = pygame.surfarray.pixels3d(surface)
+    try:
+        yield view.swapaxes(0, 1)
+    finally:
+        del view
+
+class FrameBuffer:
+    def __init__(self, source_size: typing.Tuple[int, int], size: typing.Tuple[int, int] = None, grayscale: bool = False, stack: int = 1, smooth: bool = False) -> None:
+        self.source_size = source_size
+        self.size = size if size is not None else source_size
+        self.grayscale = grayscale
+        self.stack = stack
+        self.smooth = smooth
+        width, height = self.size
+        # Downscaling renders into this surface instead of allocating a new one every frame
+        self.scaled = pygame.Surface(self.size) if self.size != source_size else None
+        shape = (height, width) if grayscale else (height, width, 3)
+        self.frames = np.zeros((stack,) + shape, dtype=np.uint8)
+        self.scratch = np.zeros((height, width), dtype=np.float32) if grayscale else None
+        self.channel = np.zeros((height, width), dtype=np.float32) if grayscale else None
+        self.head = -1
+        self.captured = 0
+        self.copies = 0
+        self.bytes_copied = 0
+
+    def nbytes(self) -> int:
+        total = self.frames.nbytes
+        if self.scratch is not None: total += self.scratch.nbytes + self.channel.nbytes
+        if self.scaled is not None: total += self.scaled.get_pitch() * self.scaled.get_height()
+        return total
+
+    def _copied(self, array: np.ndarray) -> None:
+        self.copies += 1
+        self.bytes_copied += array.nbytes
+
+    def capture(self, surface: pygame.Surface) -> np.ndarray:
+        if self.scaled is not None:
+            # smoothscale averages pixels but costs ~15x more than nearest-neighbour scale
+            if self.smooth: pygame.transform.smoothscale(surface, self.size, self.scaled)
+            else: pygame.transform.scale(surface, self.size, self.scaled)
+            surface = self.scaled
+        self.head = (self.head + 1) % self.stack
+        frame = self.frames[self.head]
+        with pixels(surface) as view:
+            if self.grayscale:
+                np.multiply(view[..., 0], GRAY_WEIGHTS[0], out=self.scratch)
+                for index in (1, 2):
+                    np.multiply(view[..., index], GRAY_WEIGHTS[index], out=self.channel)
+                    self.scratch += self.channel
+                np.copyto(frame, self.scratch, casting='unsafe')
+            else:
+                np.copyto(frame, view)
+        self._copied(frame)
+        self.captured += 1
+        return frame
+
+    def latest(self) -> np.ndarray:
+        return self.frames[max(self.head, 0)]
+
+    def stacked(self) -> np.ndarray:
+        # Oldest frame first; until the ring fills up the first capture is repeated. Each call returns a new array,
+        # since callers keep observations across steps and resets
+        stacked = np.empty_like(self.frames)
+        for slot in range(self.stack):
+            age = self.stack - 1 - slot
+            index = self.head - min(age, max(self.captured - 1, 0))
+            stacked[slot] = self.frames[index % self.stack]
+        self._copied(stacked)
+        return stacked
+
+    def reset(self) -> None:
+        self.head = -1
+        self.captured = 0
+        self.frames.fill(0)
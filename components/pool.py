@@ -0,0 +1,25 @@
+import typing
+
+class PoolStats:
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.in_use = 0
+        self.high_water = 0
+
+    def acquire(self, n: int, hit: bool) -> None:
+        if hit: self.hits += n
+        else: self.misses += n
+        self.in_use += n
+        if self.in_use > self.high_water: self.high_water = self.in_use
+
+    def release(self, n: int) -> None:
+        self.in_use -= n
+
+    def to_dict(self) -> typing.Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'in_use': self.in_use,
+            'high_water': self.high_water,
+        }
@@ -0,0 +1,117 @@
+import json
+import time
+import typing
+import threading
+import collections
+import pygame
+
+class _NullSection:
+    def __enter__(self) -> None:
+        pass
+    def __exit__(self, *_) -> None:
+        pass
+
+class _Section:
+    __slots__ = ('profiler', 'name', 'start')
+    def __init__(self, profiler: 'Profiler', name: str) -> None:
+        self.profiler = profiler
+        self.name = name
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+    def __exit__(self, *_) -> None:
+        self.profiler.record(self.name, self.start, time.perf_counter())
+
+NULL_SECTION = _NullSection()
+
+class Profiler:
+    def __init__(self, enabled: bool = False, window: int = 120, spike_ms: float = 1000 / 60, max_events: int = 200000) -> None:
+        self.enabled = enabled
+        self.tracing = False
+        self.window = window
+        self.spike_ms = spike_ms
+        self.max_events = max_events
+        self.history: typing.Dict[str, typing.Deque[float]] = {}
+        self.frame_times: typing.Deque[float] = collections.deque(maxlen=window)
+        self.current: typing.Dict[str, float] = {}
+        self.frame_start = 0.0
+        self.frames = 0
+        self.spikes = 0
+        self.events: typing.List[typing.Tuple[str, float, float, int]] = []
+        self.origin = time.perf_counter()
+        self.font: pygame.font.Font = None
+
+    def section(self, name: str):
+        if not self.enabled: return NULL_SECTION
+        return _Section(self, name)
+
+    def record(self, name: str, start: float, end: float) -> None:
+        self.current[name] = self.current.get(name, 0.0) + (end - start)
+        if self.tracing and len(self.events) < self.max_events:
+            self.events.append((name, start, end - start, threading.get_ident()))
+
+    def begin_frame(self) -> None:
+        if not self.enabled: return
+        self.current = {}
+        self.frame_start = time.perf_counter()
+
+    def end_frame(self) -> None:
+        if not self.enabled: return
+        end = time.perf_counter()
+        self.record('frame', self.frame_start, end)
+        for name in self.history.keys() | self.current.keys():
+            self.history.setdefault(name, collections.deque(maxlen=self.window)).append(self.current.get(name, 0.0))
+        frame_ms = self.current['frame'] * 1000
+        self.frame_times.append(frame_ms)
+        self.frames += 1
+        if frame_ms > self.spike_ms: self.spikes += 1
+
+    def averages(self) -> typing.Dict[str, float]:
+        return {name: sum(samples) / len(samples) * 1000 for name, samples in self.history.items() if len(samples) > 0}
+
+    def start_trace(self) -> None:
+        self.tracing = True
+        self.events = []
+
+    def export_chrome_trace(self, path: str) -> None:
+        # One trace row per thread, so render thread work shows up beside the simulation
+        threads = {}
+        events = [{
+            'name': name,
+            'cat': name.split('.')[0],
+            'ph': 'X',
+            'ts': (start - self.origin) * 1e6,
+            'dur': duration * 1e6,
+            'pid': 0,
+            'tid': threads.setdefault(thread, len(threads)),
+        } for name, start, duration, thread in self.events]
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+
+    def draw_overlay(self, screen: pygame.Surface, extra_lines: typing.Sequence[str] = ()) -> typing.Optional[pygame.Rect]:
+        if not self.enabled: return None
+        if self.font is None:
+            if not pygame.font.get_init(): pygame.font.init()
+            self.font = pygame.font.Font(None, 18)
+
+        averages = self.averages()
+        lines = [f'frame {averages.get("frame", 0):.2f} ms  spikes {self.spikes}/{self.frames}']
+        lines += [f'{name} {value:.2f} ms' for name, value in sorted(averages.items()) if name != 'frame']
+        lines += extra_lines
+
+        line_height = self.font.get_linesize()
+        graph_height = 30
+        width = 200
+        height = len(lines) * line_height + graph_height + 8
+        rect = pygame.Rect(0, screen.get_height() - height, width, height)
+        screen.fill((20, 20, 20), rect)
+        for index, line in enumerate(lines):
+            screen.blit(self.font.render(line, True, (200, 200, 200)), (rect.x + 4, rect.y + 4 + index * line_height))
+
+        baseline = rect.bottom - 2
+        for index, frame_ms in enumerate(list(self.frame_times)[-width:]):
+            bar = min(graph_height, int(frame_ms / self.spike_ms * graph_height / 2))
+            color = (220, 60, 60) if frame_ms > self.spike_ms else (60, 200, 60)
+            screen.fill(color, (rect.x + index, baseline - bar, 1, bar))
+        return rect
+
+profiler = Profiler()
@@ -0,0 +1,106 @@
+import time
+import typing
+import threading
+import collections
+import pygame
+
+class RenderThread:
+    def __init__(self, size: typing.Tuple[int, int], max_queue: int = 2, window: int = 120) -> None:
+        # Two back buffers: the thread draws into one while the main thread presents the other
+        self.buffers = [pygame.Surface(size), pygame.Surface(size)]
+        self.front = 0
+        self.ready = False
+        self.max_queue = max_queue
+        self.queue: typing.Deque = collections.deque()
+        self.condition = threading.Condition()
+        self.swap_lock = threading.Lock()
+        self.busy = False
+        self.running = True
+        self.error: typing.Optional[BaseException] = None
+        self.submitted = 0
+        self.dropped = 0
+        self.rendered = 0
+        self.presented = 0
+        self.render_time = 0.0
+        self.render_times: typing.Deque[float] = collections.deque(maxlen=window)
+        self.started = time.perf_counter()
+        self.thread = threading.Thread(target=self._run, name='render', daemon=True)
+        self.thread.start()
+
+    def submit(self, snapshot) -> None:
+        with self.condition:
+            if len(self.queue) >= self.max_queue:
+                # Only the newest state matters; what the dropped one carried moves forward
+                dropped = self.queue.popleft()
+                (self.queue[0] if len(self.queue) > 0 else snapshot).absorb(dropped)
+                self.dropped += 1
+            self.queue.append(snapshot)
+            self.submitted += 1
+            self.condition.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self.condition:
+                while self.running and len(self.queue) == 0:
+                    self.condition.wait()
+                if not self.running: return
+                snapshot = self.queue.popleft()
+                self.busy = True
+            start = time.perf_counter()
+            try:
+                snapshot.draw(self.buffers[1 - self.front])
+            except BaseException as error:
+                # Handed to the main thread by present() and wait_idle(); this thread draws nothing more
+                with self.condition:
+                    self.error = error
+                    self.busy = False
+                    self.condition.notify_all()
+                return
+            elapsed = time.perf_counter() - start
+            with self.swap_lock:
+                self.front = 1 - self.front
+                self.ready = True
+            with self.condition:
+                self.busy = False
+                self.rendered += 1
+                self.render_time += elapsed
+                self.render_times.append(elapsed)
+                self.condition.notify_all()
+
+    def _raise_error(self) -> None:
+        if self.error is not None:
+            raise RuntimeError('render thread failed') from self.error
+
+    def present(self, screen: pygame.Surface) -> bool:
+        self._raise_error()
+        with self.swap_lock:
+            if not self.ready: return False
+            screen.blit(self.buffers[self.front], (0, 0))
+            self.ready = False
+        self.presented += 1
+        return True
+
+    def wait_idle(self) -> None:
+        with self.condition:
+            while self.error is None and (self.busy or len(self.queue) > 0):
+                self.condition.wait()
+        self._raise_error()
+        with self.swap_lock:
+            self.ready = False
+
+    def stop(self) -> None:
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.thread.join()
+
+    def to_dict(self) -> dict:
+        wall = time.perf_counter() - self.started
+        return {
+            'submitted': self.submitted,
+            'dropped': self.dropped,
+            'rendered': self.rendered,
+            'presented': self.presented,
+            'render_ms_mean': sum(self.render_times) / len(self.render_times) * 1000 if len(self.render_times) > 0 else 0.0,
+            'render_busy': self.render_time / wall if wall > 0 else 0.0,
+        }
@@ -1,10 +1,18 @@
 import pygame
 import typing
 import random
-import os
+import pickle
+import hashlib
+import numpy as np
 import utils.utils as utils
-from components.widget import Button, Label, Animation
-from components.effect import EffectManager, FireworkEffect, SmokeUpEffect, SmokeCircleEffect, SparkleEffect
+from components.widget import Button, Label, Layer, Animation, WidgetDispatcher, text_cache
+from components.effect import EffectManager, QualityGovernor, FireworkEffect, SmokeUpEffect, SmokeCircleEffect, SparkleEffect, particle_pool
+from components.input import KeyboardInput
+from components.collision import CollisionStats, SpatialHash, collide, overlap
+from components.entity import EntityStore, sprite_registry
+from components.waves import WaveScheduler
+from components.assets import assets
+from components.profiler import profiler
 from utils.constants import Align, EventType
 
 class Scene:
@@ -14,50 +22,86 @@ class Scene:
         pass
     def update(self) -> None:
         pass
-    def draw(self, _: pygame.surface.Surface) -> None:
-        pass
+    def draw(self, _: pygame.surface.Surface, alpha: float = 0.0) -> typing.Optional[typing.List[pygame.Rect]]:
+        return None
     def onEnter(self) -> None:
         pass
     def onExit(self) -> None:
         pass
+    def snapshot(self, _: float = 0.0):
+        # Scenes that can be drawn off the main thread return an object with draw(screen) and absorb(older)
+        return None
+    @staticmethod
+    def preload() -> None:
+        pass
 
 class SceneManager:
-    _instance = None
-
-    def __init__(self) -> None:
-        SceneManager._instance = self
-
+    def __init__(self, dirty_rects: bool = False, full_update_ratio: float = 0.5) -> None:
+        # The last scene is the current one
         self.scenes: typing.List[Scene] = []
+        self.dirty_rects = dirty_rects
+        self.full_update_ratio = full_update_ratio
+        self.force_full_update = True
+        self.dirty_area = 0
 
     def isEmpty(self) -> bool:
         return len(self.scenes) == 0
+
+    def peek(self) -> typing.Optional[Scene]:
+        if self.isEmpty(): return None
+        return self.scenes[-1]
     
     def handle_events(self, events: typing.List[pygame.event.Event]) -> None:
         if self.isEmpty(): return
-        self.scenes[0].handle_events(events)
+        self.scenes[-1].handle_events(events)
 
     def update(self) -> None:
         if self.isEmpty(): return
-        self.scenes[0].update()
-
-    def draw(self, screen: pygame.surface.Surface) -> None:
-        if self.isEmpty(): return
-        self.scenes[0].draw(screen)
+        self.scenes[-1].update()
+
+    def snapshot(self, alpha: float = 0.0):
+        if self.isEmpty(): return None
+        return self.scenes[-1].snapshot(alpha)
+
+    def draw(self, screen: pygame.surface.Surface, alpha: float = 0.0) -> typing.Optional[typing.List[pygame.Rect]]:
+        if self.isEmpty(): return None
+        text_cache.new_frame()
+        rects = self.scenes[-1].draw(screen, alpha)
+        if not self.dirty_rects: return None
+
+        screen_area = screen.get_width() * screen.get_height()
+        if rects is None or self.force_full_update:
+            self.force_full_update = False
+            self.dirty_area = screen_area
+            return None
+        self.dirty_area = sum(rect.width * rect.height for rect in rects)
+        if self.dirty_area > self.full_update_ratio * screen_area:
+            return None
+        return rects
 
     def push(self, scene: Scene) -> None:
         self.scenes.append(scene)
+        self.force_full_update = True
         scene.onEnter()
 
-    def peek(self) -> None:
-        if self.isEmpty(): return
-        self.scenes[0].onExit()
-        self.scenes.pop(0)
+    def pop(self) -> typing.Optional[Scene]:
+        if self.isEmpty(): return None
+        scene = self.scenes.pop()
+        scene.onExit()
+        self.force_full_update = True
+        return scene
 
-    @staticmethod
-    def getInstance() -> 'SceneManager':
-        if SceneManager._instance is None:
-            SceneManager()
-        return SceneManager._instance
+    def replace(self, scene: Scene) -> None:
+        self.pop()
+        self.push(scene)
+
+    def clear(self) -> None:
+        while not self.isEmpty():
+            self.pop()
+
+    def preload(self, scene_type: typing.Type[Scene]) -> None:
+        # Warms the assets of a scene that is likely to come next without blocking the current frame
+        scene_type.preload()
 
 class ExampleScene(Scene):
     def __init__(self, scene_manager: SceneManager, color: pygame.color.Color) -> None:
@@ -68,18 +112,21 @@ class ExampleScene(Scene):
         self.background_color = color
         self.start_btn = Button(x=300, y=300, width=100, height=50, anchor=Align.Mid_Center, text="START", pressed_color=(150, 150, 150))
         self.start_btn.add_event_listener(EventType.Mouse_Touch_End, self.on_start_click)
+        self.widgets = WidgetDispatcher([self.start_btn])
         self.label = Label(x=300, y=200, text='Hello World!', anchor=Align.Mid_Center)
         sprites = [f'assets/attack_{i}.png' for i in range(1, 11)]
         self.animation = Animation(x=300, y=400, sprites=sprites, anchor=Align.Mid_Center)
 
-    def draw(self, screen: pygame.surface.Surface) -> None:
+    def draw(self, screen: pygame.surface.Surface, _: float = 0.0) -> None:
         screen.fill(self.background_color)
         self.label.draw(screen)
         self.start_btn.draw(screen)
         self.animation.draw(screen)
+        self.effect_manager.update()
         self.effect_manager.draw(screen)
         
     def handle_events(self, events: typing.List[pygame.event.Event]) -> None:
+        self.widgets.dispatch(events)
         for event in events:
             if event.type == pygame.MOUSEBUTTONDOWN:
                 self.effect_manager.add_effect(SparkleEffect(2, 0.1, pygame.mouse.get_pos()[0], pygame.mouse.get_pos()[1]))
@@ -108,19 +155,29 @@ class GameScene(Scene):
     WINDOW_WIDTH = 600
     WINDOW_HEIGHT = 600
     BG_VEL = 0.2
+    GRID_CELL_SIZE = 64
+    MAX_EFFECT_STEPS = 8
+    BACKGROUND = 'background-black.png'
     class GameObject:
-        def __init__(self, x: int, y: int, image: pygame.surface.Surface) -> None:
+        def __init__(self, x: int, y: int, sprite_type: int) -> None:
             self.x = x
             self.y = y
-            self.image = image
-            self.mask = pygame.mask.from_surface(image)
+            self.sprite = sprite_registry.get(sprite_type)
+
+        @property
+        def image(self) -> pygame.surface.Surface:
+            return self.sprite.image
+
+        @property
+        def mask(self) -> pygame.mask.Mask:
+            return self.sprite.mask
 
         def move(self, x, y):
             self.x += x
             self.y += y
 
-        def draw(self, surface: pygame.surface.Surface):
-            surface.blit(self.image, (self.x, self.y))
+        def draw(self, surface: pygame.surface.Surface) -> typing.List[pygame.Rect]:
+            return [surface.blit(self.image, (self.x, self.y))]
 
         def update(self):
             pass
@@ -136,46 +193,39 @@ class GameScene(Scene):
         
         def is_collide_with(self, obj2: 'GameScene.GameObject'):
             return self.get_mask().overlap(obj2.get_mask(), (obj2.x - self.x, obj2.y - self.y)) != None
-    
-    class Bullet(GameObject):
-        def __init__(self, x: int, y: int, image: pygame.surface.Surface, vel_y: int) -> None:
-            super().__init__(x, y, image)
-            self.vel_y = vel_y
 
     class Ship(GameObject):
         COOL_DOWN = 20
-        LASER_SOUND = pygame.mixer.Sound('assets/laser_shooting_sfx.wav')
-        DAMAGE_SOUND = pygame.mixer.Sound('assets/sfx_hurt.ogg')
-        COLLIDE_SOUND = pygame.mixer.Sound('assets/sfx_explosionFlash.ogg')
-        def __init__(self, x: int, y: int, image: pygame.surface.Surface, bullet_vel: int, bullet_img: pygame.surface.Surface, health: int) -> None:
-            super().__init__(x, y, image)
-            self.bullets: typing.List[GameScene.Bullet] = []
+        LASER_SOUND = 'laser_shooting_sfx.wav'
+        DAMAGE_SOUND = 'sfx_hurt.ogg'
+        COLLIDE_SOUND = 'sfx_explosionFlash.ogg'
+        def __init__(self, x: int, y: int, sprite_type: int, bullet_vel: int, bullet_type: int, health: int) -> None:
+            super().__init__(x, y, sprite_type)
+            self.bullets = EntityStore()
             self.bullet_vel = bullet_vel
             self.cool_down = 0
             self.health = health
-            self.bullet_img = bullet_img
-            self.butllet_sound = GameScene.Ship.LASER_SOUND
-            self.damage_sound = GameScene.Ship.DAMAGE_SOUND
-            self.collide_sound = GameScene.Ship.COLLIDE_SOUND
+            self.bullet_type = bullet_type
+            self.butllet_sound = assets.sound(GameScene.Ship.LASER_SOUND)
+            self.damage_sound = assets.sound(GameScene.Ship.DAMAGE_SOUND)
+            self.collide_sound = assets.sound(GameScene.Ship.COLLIDE_SOUND)
 
         def shoot(self):
             if (self.cool_down < GameScene.Ship.COOL_DOWN): return
             self.cool_down = 0
             self.butllet_sound.play()
-            self.bullets.append(GameScene.Bullet(self.x, self.y, self.bullet_img, self.bullet_vel))
+            self.bullets.spawn(self.x, self.y, 0, self.bullet_vel, self.bullet_type)
 
-        def draw(self, surface: pygame.surface.Surface):
-            for bullet in self.bullets:
-                bullet.draw(surface)
+        def draw(self, surface: pygame.surface.Surface, alpha: float = 0.0) -> typing.List[pygame.Rect]:
+            rects = self.bullets.draw(surface, alpha)
 
-            super().draw(surface)
+            return rects + super().draw(surface)
         
         def update(self, window_height: int):
             self.cool_down += 1
-            for bullet in self.bullets:
-                bullet.move(0, bullet.vel_y)
-                if bullet.is_off_screen(window_height):
-                    self.bullets.remove(bullet) 
+            self.bullets.step()
+            y = self.bullets.y
+            self.bullets.keep((y >= 0) & (y <= window_height))
 
         def receive_damage(self, damage, is_collided=False):
             self.health -= damage
@@ -195,34 +245,63 @@ class GameScene(Scene):
         PLAYER_SIZE = (50, 50)
         PLAYER_VEL = 5
         PLAYER_BULLET_VEL = -5
-        PLAYER_SHIP = pygame.transform.scale(pygame.image.load(os.path.join('assets', 'pixel_ship_yellow.png')), PLAYER_SIZE)
-        BULLET_YELLOW = pygame.transform.scale(pygame.image.load(os.path.join('assets', 'pixel_laser_yellow.png')), PLAYER_SIZE)
+        PLAYER_SHIP = sprite_registry.register('pixel_ship_yellow.png', PLAYER_SIZE)
+        BULLET_YELLOW = sprite_registry.register('pixel_laser_yellow.png', PLAYER_SIZE)
         def __init__(self, x: int, y: int) -> None:
             super().__init__(x, y, GameScene.Player.PLAYER_SHIP, GameScene.Player.PLAYER_BULLET_VEL, GameScene.Player.BULLET_YELLOW, GameScene.Player.MAX_HEALTH)
             self.lives = 3
             self.score = 0
+            self.bullet_grid = SpatialHash(GameScene.GRID_CELL_SIZE)
 
-        def update(self, enemies: typing.List['GameScene.Enemy'], window_height:int, effect_manager: EffectManager):
+        def update(self, enemies: EntityStore, window_height:int, effect_manager: EffectManager, collision_stats: CollisionStats):
             super().update(window_height)
 
-            for enemy in enemies:
-                if self.is_collide_with(enemy):
-                    enemies.remove(enemy)
-                    self.receive_damage(GameScene.PLAYER_DAMAGE, True)
-                    effect_manager.add_effect(SmokeCircleEffect(3, self.x, self.y, 15))
-                    continue
-                
-                for bullet in self.bullets:
-                    if bullet.is_collide_with(enemy):
-                        self.bullets.remove(bullet)
-                        enemy.receive_damage(GameScene.ENEMY_DAMAGE)
-                        self.score += 10
-                        effect_manager.add_effect(SparkleEffect(6, enemy.x + enemy.get_size()[0] // 2, enemy.y + enemy.get_size()[1] // 2))
-                        break
+            with profiler.section('sim.collisions'):
+                self.collide_enemies(enemies, effect_manager, collision_stats)
 
             if self.is_dead():
                 self.lives -= 1
                 if not self.is_end(): self.health = GameScene.Player.MAX_HEALTH
+
+        def collide_enemies(self, enemies: EntityStore, effect_manager: EffectManager, collision_stats: CollisionStats):
+            alive = np.ones(len(enemies), dtype=bool)
+            ship = self.sprite
+            collision_stats.aabb_tests += len(enemies)
+            for index in enemies.overlapping(self.x, self.y, ship.width, ship.height).tolist():
+                collision_stats.candidates += 1
+                if overlap(int(self.x), int(self.y), ship, int(enemies.pos[index, 0]), int(enemies.pos[index, 1]), enemies.sprite(index), collision_stats):
+                    alive[index] = False
+                    self.receive_damage(GameScene.PLAYER_DAMAGE, True)
+                    effect_manager.add_effect(SmokeCircleEffect(3, self.x, self.y, 15, effect_manager.rng))
+
+            bullets = self.bullets
+            if len(bullets) > 0 and len(enemies) > 0:
+                self.bullet_grid.clear()
+                bullet_sprite = sprite_registry.get(self.bullet_type)
+                bullet_x = bullets.x.astype(int).tolist()
+                bullet_y = bullets.y.astype(int).tolist()
+                for index in range(len(bullets)):
+                    self.bullet_grid.insert(index, bullet_x[index], bullet_y[index], bullet_sprite.width, bullet_sprite.height)
+
+                left, top = min(bullet_x), min(bullet_y)
+                near = enemies.overlapping(left, top, max(bullet_x) - left + bullet_sprite.width, max(bullet_y) - top + bullet_sprite.height)
+                bullet_alive = np.ones(len(bullets), dtype=bool)
+                for index in near.tolist():
+                    if not alive[index]: continue
+                    enemy = enemies.sprite(index)
+                    enemy_x, enemy_y = int(enemies.pos[index, 0]), int(enemies.pos[index, 1])
+                    for bullet in self.bullet_grid.query(enemy_x, enemy_y, enemy.width, enemy.height):
+                        if not bullet_alive[bullet]: continue
+                        collision_stats.candidates += 1
+                        if collide(bullet_x[bullet], bullet_y[bullet], bullet_sprite, enemy_x, enemy_y, enemy, collision_stats):
+                            bullet_alive[bullet] = False
+                            enemies.health[index] -= GameScene.ENEMY_DAMAGE
+                            self.score += 10
+                            effect_manager.add_effect(SparkleEffect(6, enemy_x + enemy.width // 2, enemy_y + enemy.height // 2, effect_manager.rng))
+                            break
+                bullets.keep(bullet_alive)
+
+            enemies.keep(alive)
         
         def get_lives(self) -> int:
             return self.lives
@@ -236,68 +315,210 @@ class GameScene(Scene):
             if self.y + y < window_height - self.image.get_size()[1] and self.y + y > 0:
                 self.y += y
 
-    class Enemy(Ship):
+    class Enemy:
         MAX_HEALTH = 100
         ENEMY_SIZE = (40, 40)
         ENEMY_BULLET_VEL = 5
         ENEMY_VEL = 1
-        BULLET_BLUE = pygame.transform.scale(pygame.image.load(os.path.join('assets', 'pixel_laser_blue.png')), ENEMY_SIZE)
-        BULLET_GREEN = pygame.transform.scale(pygame.image.load(os.path.join('assets', 'pixel_laser_green.png')), ENEMY_SIZE)
-        BULLET_RED = pygame.transform.scale(pygame.image.load(os.path.join('assets', 'pixel_laser_red.png')), ENEMY_SIZE)
-        ENEMY_GREEN = pygame.transform.scale(pygame.image.load(os.path.join('assets', 'pixel_ship_green_small.png')), ENEMY_SIZE)
-        ENEMY_BLUE = pygame.transform.scale(pygame.image.load(os.path.join('assets', 'pixel_ship_blue_small.png')), ENEMY_SIZE)
-        ENEMY_RED = pygame.transform.scale(pygame.image.load(os.path.join('assets', 'pixel_ship_red_small.png')), ENEMY_SIZE)
+        FIRE_CHANCE = 1 / (2 * 60)
+        BULLET_BLUE = sprite_registry.register('pixel_laser_blue.png', ENEMY_SIZE)
+        BULLET_GREEN = sprite_registry.register('pixel_laser_green.png', ENEMY_SIZE)
+        BULLET_RED = sprite_registry.register('pixel_laser_red.png', ENEMY_SIZE)
+        ENEMY_GREEN = sprite_registry.register('pixel_ship_green_small.png', ENEMY_SIZE)
+        ENEMY_BLUE = sprite_registry.register('pixel_ship_blue_small.png', ENEMY_SIZE)
+        ENEMY_RED = sprite_registry.register('pixel_ship_red_small.png', ENEMY_SIZE)
         COLOR_MAP = {
             'red': (ENEMY_RED, BULLET_RED),
             'green': (ENEMY_GREEN, BULLET_GREEN),
             'blue': (ENEMY_BLUE, BULLET_BLUE)
         }
-        def __init__(self, x: int, y: int, color: str) -> None:
-            super().__init__(x, y, GameScene.Enemy.COLOR_MAP[color][0], GameScene.Enemy.ENEMY_BULLET_VEL, GameScene.Enemy.COLOR_MAP[color][1], GameScene.Enemy.MAX_HEALTH)
-
-        def update(self, player: 'GameScene.Player', window_height:int):
-            super().update(window_height)
-
-            self.move(0, GameScene.Enemy.ENEMY_VEL)
-            
-            if random.randrange(0, 2 * 60) == 1 and self.y > 0 and self.y < window_height:
-                self.shoot()
-
-            for bullet in self.bullets:
-                if bullet.is_collide_with(player):
-                    self.bullets.remove(bullet)
+        SHIP_TYPES, SHOT_TYPES = zip(*COLOR_MAP.values())
+        BULLET_TYPES = np.zeros(len(sprite_registry.types), dtype=np.int32)
+        BULLET_TYPES[list(SHIP_TYPES)] = SHOT_TYPES
+
+        @staticmethod
+        def spawn(enemies: EntityStore, x: int, y: int, color: str) -> None:
+            enemies.spawn(x, y, 0, GameScene.Enemy.ENEMY_VEL, GameScene.Enemy.COLOR_MAP[color][0], GameScene.Enemy.MAX_HEALTH)
+
+        @staticmethod
+        def activate(enemies: EntityStore, waves: WaveScheduler, tick: int) -> None:
+            xs, ys, type_ids, cool_downs = waves.release(tick)
+            enemies.spawn_many(xs, ys, 0, GameScene.Enemy.ENEMY_VEL, type_ids, GameScene.Enemy.MAX_HEALTH, cool_downs)
+
+        @staticmethod
+        def update(enemies: EntityStore, bullets: EntityStore, window_height: int, rng: np.random.RandomState) -> None:
+            n = len(enemies)
+            enemies.cool_down[:n] += 1
+            enemies.step()
+
+            y = enemies.y
+            fire = (rng.random_sample(n) < GameScene.Enemy.FIRE_CHANCE) & (y > 0) & (y < window_height) & (enemies.cool_down[:n] >= GameScene.Ship.COOL_DOWN)
+            shooters = np.flatnonzero(fire)
+            if len(shooters) == 0: return
+            enemies.cool_down[shooters] = 0
+            assets.sound(GameScene.Ship.LASER_SOUND).play()
+            bullets.spawn_many(enemies.pos[shooters, 0], enemies.pos[shooters, 1], 0, GameScene.Enemy.ENEMY_BULLET_VEL, GameScene.Enemy.BULLET_TYPES[enemies.type_id[shooters]])
+
+        @staticmethod
+        def update_bullets(bullets: EntityStore, player: 'GameScene.Player', window_height: int, collision_stats: CollisionStats) -> None:
+            bullets.step()
+            y = bullets.y
+            alive = (y >= 0) & (y <= window_height)
+
+            ship = player.sprite
+            collision_stats.aabb_tests += len(bullets)
+            for index in bullets.overlapping(player.x, player.y, ship.width, ship.height).tolist():
+                if not alive[index]: continue
+                collision_stats.candidates += 1
+                if overlap(int(bullets.pos[index, 0]), int(bullets.pos[index, 1]), bullets.sprite(index), int(player.x), int(player.y), ship, collision_stats):
+                    alive[index] = False
                     player.receive_damage(GameScene.PLAYER_DAMAGE)
-
-        def is_reach_goal(self, HEIGHT):
-            return self.y > HEIGHT
-            
-    def __init__(self, scene_manager: SceneManager) -> None:
+            bullets.keep(alive)
+
+        @staticmethod
+        def is_reach_goal(enemies: EntityStore, HEIGHT) -> np.ndarray:
+            return enemies.y > HEIGHT
+
+    class Snapshot:
+        # Everything View needs to draw one frame, copied out of the simulation so it can be drawn on another thread
+        def __init__(self, scene: 'GameScene', alpha: float) -> None:
+            bg_offset = GameScene.BG_VEL * alpha
+            player = scene.player
+            self.view = scene.view
+            self.bg_position = (int(scene.bg_y_1 + bg_offset), int(scene.bg_y_2 + bg_offset))
+            self.hud = (player.lives, player.health, player.score)
+            self.player_sprite = player.sprite
+            self.player_position = (player.x, player.y)
+            self.entities = [player.bullets.frame(alpha), scene.enemy_bullets.frame(alpha), scene.enemies.frame(alpha)]
+            # New effects change hands here: from now on only the view steps and draws them
+            self.effects = scene.effect_manager.take_effects()
+            self.effect_steps, scene.effect_steps = scene.effect_steps, 0
+
+        def absorb(self, older: 'GameScene.Snapshot') -> None:
+            # Called when an older snapshot is dropped unseen, so its effects and ticks are not lost
+            self.effects = older.effects + self.effects
+            self.effect_steps += older.effect_steps
+
+        def draw(self, screen: pygame.Surface) -> typing.List[pygame.Rect]:
+            return self.view.draw(screen, self)
+
+    class View:
+        HUD_HEIGHT = 60
+        def __init__(self) -> None:
+            self.bg_strip: pygame.Surface = None
+            self.live_label = Label(x=10, y=10, text='', text_color=(255,255,255))
+            self.health_label = Label(x=10, y=30, text='', text_color=(255,255,255))
+            self.score_label = Label(x=550,y=10, text_color=(255,255,255), anchor=Align.Top_Right)
+            self.hud = Layer([self.live_label, self.health_label, self.score_label], GameScene.WINDOW_WIDTH, GameScene.View.HUD_HEIGHT)
+            self.effect_manager = EffectManager(governor=QualityGovernor())
+            self.blits = 0
+
+        def background(self, bg_y: int) -> tuple:
+            # The background scrolls with a period of one window height, so the two tiles stacked
+            # vertically contain every frame as a single window-sized area
+            width, height = GameScene.WINDOW_WIDTH, GameScene.WINDOW_HEIGHT
+            if self.bg_strip is None:
+                image = assets.image(GameScene.BACKGROUND, (width, height), alpha=False)
+                strip = pygame.Surface((width, height * 2))
+                strip.blit(image, (0, 0))
+                strip.blit(image, (0, height))
+                self.bg_strip = strip.convert() if pygame.display.get_surface() is not None else strip
+            return (self.bg_strip, (0, 0), pygame.Rect(0, (height - bg_y) % height, width, height))
+
+        def draw(self, screen: pygame.Surface, snapshot: 'GameScene.Snapshot') -> typing.List[pygame.Rect]:
+            # Snapshots drawn on the render thread never go through SceneManager.draw, so the frame starts here
+            text_cache.new_frame()
+            lives, health, score = snapshot.hud
+            self.live_label.set_text(f'Live: {lives}')
+            self.health_label.set_text(f'Health: {health}')
+            self.score_label.set_text(f'Score: {score}')
+            with profiler.section('draw.sprites'):
+                # Background, HUD and every sprite go through one blits call, in the original draw order
+                player_bullets, enemy_bullets, enemies = snapshot.entities
+                sequence = [self.background(snapshot.bg_position[0])]
+                hud = self.hud.blit_item()
+                if hud is not None: sequence.append(hud)
+                sequence += player_bullets.blit_sequence()
+                sequence.append((snapshot.player_sprite.image, snapshot.player_position))
+                sequence += enemy_bullets.blit_sequence()
+                sequence += enemies.blit_sequence()
+                rects = screen.blits(sequence)
+            with profiler.section('draw.effects'):
+                for effect in snapshot.effects:
+                    self.effect_manager.add_effect(effect)
+                effect_rects = self.effect_manager.render(screen, min(snapshot.effect_steps, GameScene.MAX_EFFECT_STEPS))
+            self.blits = len(sequence) + len(effect_rects)
+            # The background covers the whole window, so leave it out of the dirty rects
+            return rects[1:] + effect_rects
+
+    class State:
+        # A checkpoint of everything the simulation needs to carry on: plain numbers and arrays, with sprites kept as
+        # registry ids, so it is cheap to take, safe to restore into any number of scenes and small when pickled
+        def __init__(self, scene: 'GameScene') -> None:
+            player = scene.player
+            self.player = (player.x, player.y, player.sprite.type_id, player.health, player.cool_down, player.lives, player.score)
+            self.player_bullets = player.bullets.save_state()
+            self.enemies = scene.enemies.save_state()
+            self.enemy_bullets = scene.enemy_bullets.save_state()
+            self.waves = scene.waves.save_state()
+            self.progress = (scene.tick, scene.level, scene.enemies_number, scene.lost_count, scene.is_running, scene.bg_y_1, scene.bg_y_2, scene.effect_steps)
+            self.random = scene.random.getstate()
+            self.np_random = scene.np_random.get_state()
+            self.effect_random = scene.effect_manager.rng.get_state()
+            self.effects = scene.effect_manager.save_effects()
+            self.view_effects = scene.view.effect_manager.save_effects()
+
+        def to_bytes(self) -> bytes:
+            return pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)
+
+        @staticmethod
+        def from_bytes(data: bytes) -> 'GameScene.State':
+            return pickle.loads(data)
+
+    def __init__(self, scene_manager: SceneManager, input_source=None, seed: int = None) -> None:
+        self.seed = seed if seed is not None else random.randrange(2 ** 32)
+        self.random = random.Random(self.seed)
+        self.np_random = np.random.RandomState(self.seed)
+        self.input_source = input_source if input_source is not None else KeyboardInput()
         self.player = GameScene.Player(GameScene.START_POSITION[0], GameScene.START_POSITION[1])
         self.window_width = GameScene.WINDOW_WIDTH
         self.window_height = GameScene.WINDOW_HEIGHT
-        self.enemies: typing.List[GameScene.Enemy] = list()
-        self.img_bg = pygame.transform.scale(pygame.image.load(os.path.join('assets', 'background-black.png')), (GameScene.WINDOW_WIDTH, GameScene.WINDOW_HEIGHT))
-        self.live_label = Label(x=10, y=10, text='', text_color=(255,255,255))
-        self.health_label = Label(x=10, y=30, text='', text_color=(255,255,255))
+        self.enemies = EntityStore()
+        self.enemy_bullets = EntityStore()
+        # Enemies above the window stay dormant in the scheduler until they are about to become visible
+        self.waves = WaveScheduler(-GameScene.Enemy.ENEMY_SIZE[1], GameScene.Enemy.ENEMY_VEL)
+        self.tick = 0
         self.end_game_label = Label(x=250, y=250, text='You Lose!', text_color=(255,255,255))
         self.end_game_label.set_visible(False)
-        self.score_label = Label(x=550,y=10, text_color=(255,255,255), anchor=Align.Top_Right)
         self.level = 0
         self.enemies_number = 0
-        self.effect_manager = EffectManager()
+        # Effects advance while drawing, so they get their own stream to keep the simulation independent of rendering.
+        # The simulation only adds effects here; the view takes them over with the next snapshot
+        self.effect_manager = EffectManager(np.random.RandomState((self.seed + 1) % 2 ** 32))
+        # Simulation ticks since the last snapshot; the view catches the effects up by that many steps
+        self.effect_steps = 0
+        # Runs that never draw turn this off, or nothing would ever take the effects off the queue
+        self.queue_effects = True
+        self.view = GameScene.View()
+        self.collision_stats = CollisionStats()
         self.lost_count = 0
         self.is_running = True
         self.scene_manager = scene_manager
         self.btn_back = Button(x=300, y=300, width=150, height=40, pressed_color=(50,50,50), text='Back', anchor=Align.Mid_Center)
         self.btn_back.set_visible(False)
         self.btn_back.add_event_listener(EventType.Mouse_Touch_End, self.on_back)
+        self.widgets = WidgetDispatcher([self.btn_back])
         self.bg_y_1 = 0
         self.bg_y_2 = -self.window_height
+        self.drawn_bg_position = None
+        self.game_factory: typing.Callable[[SceneManager], GameScene] = None
+        self.drawn_rects: typing.Optional[typing.List[pygame.Rect]] = None
 
-    def handle_events(self, _: typing.List[pygame.event.Event]) -> None:
+    def handle_events(self, events: typing.List[pygame.event.Event]) -> None:
+        self.widgets.dispatch(events)
         if not self.is_running: return
 
-        keys = pygame.key.get_pressed()
+        keys = self.input_source.get_pressed()
 
         if keys[pygame.K_LEFT]:
             self.player.move(-GameScene.Player.PLAYER_VEL, 0, self.window_width, self.window_height)
@@ -312,15 +533,16 @@ class GameScene(Scene):
             self.player.shoot()
 
     def update(self) -> None:
+        self.collision_stats.reset()
+        self.effect_steps += 1
+        if not self.queue_effects:
+            self.effect_manager.clear()
+            self.effect_steps = 0
         self.bg_y_1 += GameScene.BG_VEL
         self.bg_y_2 += GameScene.BG_VEL
         if (self.bg_y_1 >= self.window_height): self.bg_y_1 = - self.window_height
         if (self.bg_y_2 >= self.window_height): self.bg_y_2 = - self.window_height
 
-        self.live_label.set_text(f'Live: {self.player.lives}')
-        self.health_label.set_text(f'Health: {self.player.health}')
-        self.score_label.set_text(f'Score: {self.player.score}')
-
         if self.player.is_end():
             self.is_running = False
             self.end_game_label.set_visible(True)
@@ -328,56 +550,143 @@ class GameScene(Scene):
     
         if not self.is_running: return
 
-        if len(self.enemies) == 0:
+        if len(self.enemies) == 0 and len(self.waves) == 0:
             self.level += 1
             self.enemies_number += GameScene.ENEMY_NUMBER
+            xs, ys, type_ids = [], [], []
             for _ in range(self.enemies_number):
-                enemy = GameScene.Enemy(random.randrange(50, self.window_width - 100), random.randrange(-500, -50), random.choice(['red', 'green', 'blue']))
-                self.enemies.append(enemy)
-
-        self.player.update(self.enemies, self.window_height, self.effect_manager)
-        for enemy in self.enemies:
-            if enemy.is_reach_goal(self.window_height) or enemy.is_dead():
-                self.enemies.remove(enemy)
-                if enemy.is_reach_goal(self.window_height): self.player.receive_damage(GameScene.PLAYER_DAMAGE)
-            else:
-                enemy.update(self.player, self.window_height)
-
-    def draw(self, screen: pygame.surface.Surface) -> None:
-        screen.fill((0,0,0))
-        screen.blit(self.img_bg, (0, int(self.bg_y_1)))
-        screen.blit(self.img_bg, (0, int(self.bg_y_2)))
-        self.live_label.draw(screen)
-        self.health_label.draw(screen)
-        self.score_label.draw(screen)
-        self.player.draw(screen)
-        for enemy in self.enemies:
-            enemy.draw(screen)
-        self.effect_manager.draw(screen)
-        self.end_game_label.draw(screen)
-        self.btn_back.draw(screen)
-        
+                xs.append(self.random.randrange(50, self.window_width - 100))
+                ys.append(self.random.randrange(-500, -50))
+                type_ids.append(GameScene.Enemy.COLOR_MAP[self.random.choice(['red', 'green', 'blue'])][0])
+            self.waves.schedule(self.tick, np.array(xs, dtype=np.float64), np.array(ys, dtype=np.float64), np.array(type_ids, dtype=np.int32))
+        GameScene.Enemy.activate(self.enemies, self.waves, self.tick)
+        self.tick += 1
+
+        with profiler.section('sim.player'):
+            self.player.update(self.enemies, self.window_height, self.effect_manager, self.collision_stats)
+
+        with profiler.section('sim.enemies'):
+            reach_goal = GameScene.Enemy.is_reach_goal(self.enemies, self.window_height)
+            for _ in range(int(np.count_nonzero(reach_goal))):
+                self.player.receive_damage(GameScene.PLAYER_DAMAGE)
+            self.enemies.keep(~reach_goal & (self.enemies.health[:len(self.enemies)] > 0))
+
+            GameScene.Enemy.update(self.enemies, self.enemy_bullets, self.window_height, self.np_random)
+        with profiler.section('sim.collisions'):
+            GameScene.Enemy.update_bullets(self.enemy_bullets, self.player, self.window_height, self.collision_stats)
+
+    def snapshot(self, alpha: float = 0.0) -> typing.Optional['GameScene.Snapshot']:
+        # The end screen has a live button, so it is drawn on the main thread
+        if not self.is_running: return None
+        return GameScene.Snapshot(self, alpha)
+
+    def draw(self, screen: pygame.surface.Surface, alpha: float = 0.0) -> typing.Optional[typing.List[pygame.Rect]]:
+        snapshot = GameScene.Snapshot(self, alpha)
+        bg_position = snapshot.bg_position
+        rects = snapshot.draw(screen)
+        with profiler.section('draw.widgets'):
+            rects.append(self.end_game_label.draw(screen))
+            rects.append(self.btn_back.draw(screen))
+
+        rects = [rect for rect in rects if rect is not None]
+        previous, self.drawn_rects = self.drawn_rects, rects
+        bg_moved, self.drawn_bg_position = bg_position != self.drawn_bg_position, bg_position
+        if bg_moved or previous is None: return None
+        return previous + rects
+
     def onEnter(self) -> None:
         pass
     def onExit(self) -> None:
-        pass
+        self.input_source.close()
+
+    @staticmethod
+    def preload() -> None:
+        names = [sprite.name for sprite in sprite_registry.types]
+        assets.preload_async(names + [GameScene.BACKGROUND, SmokeUpEffect.SPRITES.name])
+
+    def get_pool_stats(self) -> typing.Dict[str, typing.Dict[str, int]]:
+        return {
+            'enemies': self.enemies.stats.to_dict(),
+            'player_bullets': self.player.bullets.stats.to_dict(),
+            'enemy_bullets': self.enemy_bullets.stats.to_dict(),
+            'particle_buffers': particle_pool.stats.to_dict(),
+        }
+
+    def get_entity_counts(self) -> typing.Dict[str, int]:
+        return {
+            'enemies': len(self.enemies),
+            'dormant_enemies': len(self.waves),
+            'player_bullets': len(self.player.bullets),
+            'enemy_bullets': len(self.enemy_bullets),
+            'effects': len(self.effect_manager.effects) + len(self.view.effect_manager.effects),
+            'particles': sum(len(effect.particles) for effect in self.effect_manager.effects + self.view.effect_manager.effects),
+        }
+
+    def get_state_digest(self) -> str:
+        digest = hashlib.sha1()
+        digest.update(repr((self.level, self.player.x, self.player.y, self.player.health, self.player.lives, self.player.score)).encode())
+        for store in (self.enemies, self.enemy_bullets, self.player.bullets):
+            digest.update(store.pos[:len(store)].tobytes())
+            digest.update(store.health[:len(store)].tobytes())
+        digest.update(self.waves.ticks[self.waves.next:].tobytes())
+        return digest.hexdigest()
+
+    def save_state(self) -> 'GameScene.State':
+        return GameScene.State(self)
+
+    def load_state(self, state: 'GameScene.State') -> None:
+        player = self.player
+        player.x, player.y, sprite_type, player.health, player.cool_down, player.lives, player.score = state.player
+        player.sprite = sprite_registry.get(sprite_type)
+        player.bullets.load_state(state.player_bullets)
+        self.enemies.load_state(state.enemies)
+        self.enemy_bullets.load_state(state.enemy_bullets)
+        self.waves.load_state(state.waves)
+        self.tick, self.level, self.enemies_number, self.lost_count, self.is_running, self.bg_y_1, self.bg_y_2, self.effect_steps = state.progress
+        self.random.setstate(state.random)
+        self.np_random.set_state(state.np_random)
+        self.effect_manager.rng.set_state(state.effect_random)
+        self.effect_manager.load_effects(state.effects, self.effect_manager.rng)
+        self.view.effect_manager.load_effects(state.view_effects, self.effect_manager.rng)
+        self.end_game_label.set_visible(not self.is_running)
+        self.btn_back.set_visible(not self.is_running)
+        self.drawn_rects = None
+        self.drawn_bg_position = None
 
     def on_back(self, _) -> None:
-        self.scene_manager.push(StartScene(self.scene_manager))
-        self.scene_manager.peek()
+        self.scene_manager.replace(StartScene(self.scene_manager, self.game_factory))
 
 class StartScene(Scene):
-    def __init__(self, scene_manager: SceneManager) -> None:
+    def __init__(self, scene_manager: SceneManager, game_factory: typing.Callable[[SceneManager], GameScene] = None) -> None:
         self.scene_manager = scene_manager
+        self.game_factory = game_factory
         self.btn_start = Button(x=300, y=300, width=100, height=50, text='Start', pressed_color=(50,50,50), anchor=Align.Mid_Center)
         self.btn_start.add_event_listener(EventType.Mouse_Touch_End, self.on_start_game)
+        self.widgets = WidgetDispatcher([self.btn_start])
         self.title_label = Label(x=300, y=200, text="Space Shooter", text_color=(255, 255, 0), anchor=Align.Mid_Center, font_size=80)
+        self.drawn_state = None
 
-    def draw(self, screen: pygame.Surface) -> None:
-        screen.fill((0,0,0))
-        self.title_label.draw(screen)
-        self.btn_start.draw(screen)
+    def handle_events(self, events: typing.List[pygame.event.Event]) -> None:
+        self.widgets.dispatch(events)
+
+    def draw(self, screen: pygame.Surface, _: float = 0.0) -> typing.Optional[typing.List[pygame.Rect]]:
+        state = (self.title_label.visual_state(), self.btn_start.visual_state())
+        if state != self.drawn_state:
+            screen.fill((0,0,0))
+            self.title_label.draw(screen)
+            self.btn_start.draw(screen)
+            self.drawn_state = (self.title_label.visual_state(), self.btn_start.visual_state())
+            return None
+
+        btn_rect = self.btn_start.draw(screen)
+        self.drawn_state = (self.title_label.visual_state(), self.btn_start.visual_state())
+        return [btn_rect] if self.drawn_state != state else []
+
+    def onEnter(self) -> None:
+        self.drawn_state = None
+        self.scene_manager.preload(GameScene)
 
     def on_start_game(self, _) -> None:
-        self.scene_manager.push(GameScene(self.scene_manager))
-        self.scene_manager.peek()
\ No newline at end of file
+        game = self.game_factory(self.scene_manager) if self.game_factory is not None else GameScene(self.scene_manager)
+        game.game_factory = self.game_factory
+        self.scene_manager.replace(game)
\ No newline at end of file
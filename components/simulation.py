@@ -0,0 +1,206 @@
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import time
+import typing
+import pygame
+import utils.utils as utils
+from components.scene import SceneManager, GameScene
+from components.entity import sprite_registry
+from components.assets import assets
+from components.input import ScriptedInput, ReplayInput, ReplayLog, InputRecorder, POLICIES
+from components.widget import text_cache
+from components.profiler import profiler
+from components.render_thread import RenderThread
+
+WIN_WIDTH = 600
+WIN_HEIGHT = 600
+FPS = 60
+
+def init_headless() -> pygame.Surface:
+    # Display and fonts only: nothing is heard, and the mixer's own thread is not worth starting
+    pygame.display.init()
+    pygame.font.init()
+    assets.audio = False
+    screen = pygame.display.get_surface()
+    if screen is None:
+        screen = pygame.display.set_mode((WIN_WIDTH, WIN_HEIGHT))
+    return screen
+
+class LevelStats:
+    def __init__(self, level: int, lives: int = 0, score: int = 0) -> None:
+        self.level = level
+        self.ticks = 0
+        self.peak: typing.Dict[str, int] = {}
+        self.total: typing.Dict[str, int] = {}
+        self.start_lives = self.lives = lives
+        self.start_score = self.score = score
+        self.cleared = False
+
+    def add(self, counts: typing.Dict[str, int]) -> None:
+        self.ticks += 1
+        for name, count in counts.items():
+            self.peak[name] = max(self.peak.get(name, 0), count)
+            self.total[name] = self.total.get(name, 0) + count
+
+    def to_dict(self) -> dict:
+        return {
+            'level': self.level,
+            'ticks': self.ticks,
+            'peak': dict(self.peak),
+            'mean': {name: total / self.ticks for name, total in self.total.items()},
+            'cleared': self.cleared,
+            'lives_lost': self.start_lives - self.lives,
+            'score': self.score - self.start_score,
+        }
+
+class RunReport:
+    def __init__(self, tick_times: typing.List[float], levels: typing.List[LevelStats], wall_time: float, pools: typing.Dict[str, typing.Dict[str, int]] = None, digest: str = '', sections: typing.Dict[str, float] = None, score: int = 0, lives: int = 0, render_thread: dict = None, draw_times: typing.List[float] = None) -> None:
+        self.sections = sections if sections is not None else {}
+        self.draw_times = draw_times if draw_times is not None else []
+        self.render_thread = render_thread
+        self.score = score
+        self.lives = lives
+        self.tick_times = tick_times
+        self.levels = levels
+        self.wall_time = wall_time
+        self.pools = pools if pools is not None else {}
+        self.digest = digest
+
+    def ticks(self) -> int:
+        return len(self.tick_times)
+
+    def ticks_per_second(self) -> float:
+        return self.ticks() / self.wall_time if self.wall_time > 0 else 0.0
+
+    def tick_ms(self, q: float) -> float:
+        return utils.percentile(self.tick_times, q) * 1000
+
+    def to_dict(self) -> dict:
+        return {
+            'ticks': self.ticks(),
+            'simulated_seconds': self.ticks() / FPS,
+            'wall_seconds': self.wall_time,
+            'ticks_per_second': self.ticks_per_second(),
+            'p50_ms': self.tick_ms(50),
+            'p99_ms': self.tick_ms(99),
+            'draw_p50_ms': utils.percentile(self.draw_times, 50) * 1000,
+            'draw_p99_ms': utils.percentile(self.draw_times, 99) * 1000,
+            'score': self.score,
+            'lives': self.lives,
+            'levels': [level.to_dict() for level in self.levels],
+            'pools': self.pools,
+            'digest': self.digest,
+            'sections_ms': self.sections,
+            'render_thread': self.render_thread,
+        }
+
+    def format(self) -> str:
+        lines = [
+            f'ticks: {self.ticks()} ({self.ticks() / FPS:.1f}s simulated in {self.wall_time:.2f}s)',
+            f'ticks/s: {self.ticks_per_second():.0f}',
+            f'tick p50: {self.tick_ms(50):.3f} ms  p99: {self.tick_ms(99):.3f} ms',
+            f'score: {self.score}  lives: {self.lives}',
+        ]
+        if len(self.draw_times) > 0:
+            lines.append(f'draw p50: {utils.percentile(self.draw_times, 50) * 1000:.3f} ms  p99: {utils.percentile(self.draw_times, 99) * 1000:.3f} ms')
+        for level in self.levels:
+            peak = ', '.join(f'{name}={count:.3g}' if isinstance(count, float) else f'{name}={count}' for name, count in level.peak.items())
+            lines.append(f'level {level.level}: {level.ticks} ticks, {"cleared" if level.cleared else "not cleared"}, lives lost {level.start_lives - level.lives}, score {level.score - level.start_score}, peak {peak}')
+        for name, stats in self.pools.items():
+            lines.append(f'pool {name}: ' + ', '.join(f'{key}={value}' for key, value in stats.items()))
+        for name, value in sorted(self.sections.items()):
+            lines.append(f'section {name}: {value:.4f} ms')
+        if self.render_thread is not None:
+            sim_busy = sum(self.tick_times) / self.wall_time if self.wall_time > 0 else 0.0
+            lines.append(f'render thread: ' + ', '.join(f'{key}={value:.3f}' if isinstance(value, float) else f'{key}={value}' for key, value in self.render_thread.items()))
+            lines.append(f'sim thread busy: {sim_busy:.3f}  overlap: {sim_busy + self.render_thread["render_busy"]:.2f}x')
+        lines.append(f'final state digest: {self.digest}')
+        return '\n'.join(lines)
+
+class HeadlessRunner:
+    def __init__(self, policy: str = 'sweep', seed: int = 0, render: bool = False, scene_factory: typing.Callable[..., GameScene] = None, replay: ReplayLog = None, record: bool = False, threaded: bool = False) -> None:
+        self.screen = init_headless()
+        self.render = render
+        self.renderer = None
+        if render and threaded:
+            sprite_registry.load()
+            self.renderer = RenderThread(self.screen.get_size())
+        self.draw_times: typing.List[float] = []
+        self.replay = replay
+        if replay is not None:
+            seed = replay.seed
+            self.input_source = ReplayInput(replay)
+        else:
+            self.input_source = ScriptedInput(POLICIES[policy](seed))
+        if record:
+            self.input_source = InputRecorder(self.input_source, seed)
+        self.scene_manager = SceneManager()
+        factory = scene_factory if scene_factory is not None else GameScene
+        self.scene = factory(self.scene_manager, self.input_source, seed)
+        self.scene.queue_effects = render
+        self.scene_manager.push(self.scene)
+
+    def step(self) -> None:
+        profiler.begin_frame()
+        with profiler.section('input'):
+            events = pygame.event.get()
+            self.scene_manager.handle_events(events)
+        with profiler.section('sim'):
+            self.scene_manager.update()
+        if self.render:
+            snapshot = self.scene_manager.snapshot() if self.renderer is not None else None
+            if snapshot is not None:
+                self.renderer.submit(snapshot)
+                self.renderer.present(self.screen)
+            else:
+                if self.renderer is not None: self.renderer.wait_idle()
+                draw_start = time.perf_counter()
+                with profiler.section('draw'):
+                    self.scene_manager.draw(self.screen)
+                self.draw_times.append(time.perf_counter() - draw_start)
+        profiler.end_frame()
+
+    def run(self, ticks: int, stop_on_end: bool = True) -> RunReport:
+        tick_times: typing.List[float] = []
+        levels: typing.List[LevelStats] = []
+        start = time.perf_counter()
+        for _ in range(ticks):
+            if self.scene_manager.isEmpty(): break
+            if self.replay is not None and self.input_source.is_finished(): break
+            tick_start = time.perf_counter()
+            self.step()
+            tick_times.append(time.perf_counter() - tick_start)
+
+            player = self.scene.player
+            if len(levels) == 0 or levels[-1].level != self.scene.level:
+                if len(levels) > 0: levels[-1].cleared = True
+                levels.append(LevelStats(self.scene.level, levels[-1].lives if len(levels) > 0 else player.lives, levels[-1].score if len(levels) > 0 else 0))
+            levels[-1].lives = player.lives
+            levels[-1].score = player.score
+            counts = self.scene.get_entity_counts()
+            counts.update(self.scene.collision_stats.to_dict())
+            if self.render:
+                counts['text_renders'] = text_cache.frame_render_calls
+                counts['blits'] = self.scene.view.blits
+                counts.update(self.scene.view.effect_manager.governor.to_dict())
+            levels[-1].add(counts)
+
+            if stop_on_end and not self.scene.is_running: break
+        if self.renderer is not None: self.renderer.wait_idle()
+        wall_time = time.perf_counter() - start
+        render_thread = self.renderer.to_dict() if self.renderer is not None else None
+        return RunReport(tick_times, levels, wall_time, self.scene.get_pool_stats(), self.scene.get_state_digest(), profiler.averages(), self.scene.player.score, self.scene.player.lives, render_thread, self.draw_times)
+
+    def save_state(self) -> GameScene.State:
+        # The render thread owns the view's effects while it draws
+        if self.renderer is not None: self.renderer.wait_idle()
+        return self.scene.save_state()
+
+    def load_state(self, state: GameScene.State) -> None:
+        if self.renderer is not None: self.renderer.wait_idle()
+        self.scene.load_state(state)
+
+    def close(self) -> None:
+        if self.renderer is not None: self.renderer.stop()
@@ -0,0 +1,46 @@
+import time
+import typing
+
+class FixedTimestep:
+    def __init__(self, dt: float, max_steps: int = 5, max_frame_time: float = 0.25) -> None:
+        self.dt = dt
+        self.max_steps = max_steps
+        self.max_frame_time = max_frame_time
+        self.accumulator = 0.0
+        self.last_time: float = None
+        self.frames = 0
+        self.steps = 0
+        self.caught_up = 0
+        self.dropped = 0
+        self.idle_frames = 0
+
+    def advance(self, now: float = None) -> int:
+        now = now if now is not None else time.perf_counter()
+        elapsed = 0.0 if self.last_time is None else now - self.last_time
+        self.last_time = now
+        self.accumulator += min(elapsed, self.max_frame_time)
+
+        steps = min(int(self.accumulator / self.dt), self.max_steps)
+        self.accumulator -= steps * self.dt
+        if self.accumulator >= self.dt:
+            # Too far behind to catch up: let the game slow down rather than spiral
+            self.dropped += int(self.accumulator / self.dt)
+            self.accumulator %= self.dt
+
+        self.frames += 1
+        self.steps += steps
+        if steps > 1: self.caught_up += steps - 1
+        if steps == 0: self.idle_frames += 1
+        return steps
+
+    def alpha(self) -> float:
+        return max(0.0, self.accumulator / self.dt)
+
+    def to_dict(self) -> typing.Dict[str, int]:
+        return {
+            'frames': self.frames,
+            'steps': self.steps,
+            'caught_up': self.caught_up,
+            'dropped': self.dropped,
+            'idle_frames': self.idle_frames,
+        }
@@ -0,0 +1,46 @@
+import typing
+import numpy as np
+
+class WaveScheduler:
+    # Enemies of a wave wait here as plain arrays, ordered by the tick they reach entry_y, and cost nothing
+    # per tick until they are released into the live EntityStore
+    def __init__(self, entry_y: float, vel: float) -> None:
+        self.entry_y = entry_y
+        self.vel = vel
+        self.clear()
+
+    def __len__(self) -> int:
+        return len(self.ticks) - self.next
+
+    def clear(self) -> None:
+        self.next = 0
+        self.ticks = np.zeros(0, dtype=np.int64)
+        self.xs = np.zeros(0, dtype=np.float64)
+        self.ys = np.zeros(0, dtype=np.float64)
+        self.type_ids = np.zeros(0, dtype=np.int32)
+        self.cool_downs = np.zeros(0, dtype=np.int32)
+
+    def schedule(self, tick: int, xs: np.ndarray, ys: np.ndarray, type_ids: np.ndarray) -> None:
+        # Fast-forward each enemy to where it would be when it reaches entry_y, as if it had been live all along
+        delays = np.maximum(np.ceil((self.entry_y - ys) / self.vel), 0).astype(np.int64)
+        ticks = np.concatenate((self.ticks[self.next:], tick + delays))
+        order = np.argsort(ticks, kind='stable')
+        self.ticks = ticks[order]
+        self.xs = np.concatenate((self.xs[self.next:], xs))[order]
+        self.ys = np.concatenate((self.ys[self.next:], ys + delays * self.vel))[order]
+        self.type_ids = np.concatenate((self.type_ids[self.next:], type_ids))[order]
+        self.cool_downs = np.concatenate((self.cool_downs[self.next:], delays))[order].astype(np.int32)
+        self.next = 0
+
+    def release(self, tick: int) -> typing.Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        start, end = self.next, int(np.searchsorted(self.ticks, tick, side='right'))
+        self.next = max(start, end)
+        return self.xs[start:self.next], self.ys[start:self.next], self.type_ids[start:self.next], self.cool_downs[start:self.next]
+
+    def save_state(self) -> typing.Tuple[np.ndarray, ...]:
+        return self.ticks[self.next:], self.xs[self.next:], self.ys[self.next:], self.type_ids[self.next:], self.cool_downs[self.next:]
+
+    def load_state(self, state: typing.Tuple[np.ndarray, ...]) -> None:
+        # schedule() always builds fresh arrays, so saved and restored states can share them
+        self.next = 0
+        self.ticks, self.xs, self.ys, self.type_ids, self.cool_downs = state
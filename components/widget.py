@@ -1,9 +1,46 @@
 import pygame
 import utils.utils as utils
 import typing
+import collections
 from utils.constants import Align, EventType, EventParam
 
-pygame.init()
+class FontRegistry:
+    def __init__(self) -> None:
+        self.fonts: typing.Dict[typing.Tuple[typing.Optional[str], int], pygame.font.Font] = {}
+
+    def get(self, font: typing.Optional[str], font_size: int) -> pygame.font.Font:
+        key = (font, font_size)
+        if key not in self.fonts:
+            if not pygame.font.get_init(): pygame.font.init()
+            self.fonts[key] = pygame.font.Font(font, font_size)
+        return self.fonts[key]
+
+class TextCache:
+    def __init__(self, max_size: int = 256) -> None:
+        self.max_size = max_size
+        self.surfaces: typing.OrderedDict[tuple, pygame.Surface] = collections.OrderedDict()
+        self.render_calls = 0
+        self.frame_render_calls = 0
+
+    def new_frame(self) -> None:
+        self.frame_render_calls = 0
+
+    def render(self, font: pygame.font.Font, text: str, antialias: bool, color) -> pygame.Surface:
+        key = (id(font), text, antialias, tuple(color))
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            return surface
+        self.render_calls += 1
+        self.frame_render_calls += 1
+        surface = font.render(text, antialias, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_size:
+            self.surfaces.popitem(last=False)
+        return surface
+
+fonts = FontRegistry()
+text_cache = TextCache()
 
 class Widget:
     def __init__(self, x: int, y: int, z: int, visible: bool) -> None:
@@ -11,8 +48,24 @@ class Widget:
         self.y = y
         self.z = z
         self.visible = visible
-    def draw(self, _: pygame.surface.Surface) -> None:
+        self.event_listeners: typing.Dict[EventType, typing.Callable[[dict], None]] = {}
+    def draw(self, _: pygame.surface.Surface) -> typing.Optional[pygame.Rect]:
         pass
+    def add_event_listener(self, type: EventType, handler: typing.Callable[[dict], None]) -> None:
+        self.event_listeners[type] = handler
+    def emit(self, type: EventType, params: dict) -> bool:
+        handler = self.event_listeners.get(type)
+        if handler is None: return False
+        handler(params)
+        return True
+    def hit_test(self, _: typing.Tuple[int, int]) -> bool:
+        return False
+    def on_mouse_down(self, _: typing.Tuple[int, int]) -> None:
+        pass
+    def on_mouse_up(self, _: typing.Tuple[int, int]) -> None:
+        pass
+    def visual_state(self) -> tuple:
+        return (self.x, self.y, self.visible)
     def set_position(self, x: int = None, y: int = None) -> None:
         if x is not None: self.x = x
         if y is not None: self.y = y
@@ -23,7 +76,6 @@ class Button(Widget):
     def __init__(self, x=0, y=0, z=0, visible=True, text='', bg_color=(255,255,255), text_color=(0,0,0), anchor=Align.Top_Left, width=0, height=0, font=None, font_size=30, pressed_color:pygame.color.Color=None, disabled_color:pygame.color.Color=None, disabled=False) -> None:
         super().__init__(x, y, z, visible)
         self.is_clicked = False
-        self.event_listeners: dict[EventType, typing.Callable[[dict], None]] = {}
         self.text = text
         self.bg_color = bg_color
         self.text_color = text_color
@@ -36,26 +88,30 @@ class Button(Widget):
 
         pos_x, pos_y = utils.align(x, y, width, height, anchor)
         self.rect = pygame.Rect(pos_x, pos_y, width, height)
-        self.font = pygame.font.Font(font, font_size)
-    def draw(self, screen: pygame.surface.Surface) -> None:
-        if not self.visible: return
-
-        mouse_pos = pygame.mouse.get_pos()
-        if self.rect.collidepoint(mouse_pos):
-            if pygame.mouse.get_pressed()[0] == 1 and not self.is_clicked:
-                self.is_clicked = True
-            if pygame.mouse.get_pressed()[0] == 0 and self.is_clicked:
-                self.is_clicked = False
-                if EventType.Mouse_Touch_End in self.event_listeners:
-                    hanlder = self.event_listeners[EventType.Mouse_Touch_End]
-                    hanlder({EventParam.x: mouse_pos[0], EventParam.y: mouse_pos[1]})
+        self.font = fonts.get(font, font_size)
+        self.text_surface: pygame.Surface = None
+    def draw(self, screen: pygame.surface.Surface) -> typing.Optional[pygame.Rect]:
+        if not self.visible: return None
 
         pygame.draw.rect(screen, self.disabled_color if self.disabled else self.pressed_color if self.is_clicked else self.bg_color, self.rect)
         pos_x, pos_y = utils.align(self.x, self.y, self.width, self.height, self.anchor)
-        text_label = self.font.render(self.text, True, self.text_color)
+        if self.text_surface is None:
+            self.text_surface = text_cache.render(self.font, self.text, True, self.text_color)
+        text_label = self.text_surface
         screen.blit(text_label, (pos_x + self.width // 2 - text_label.get_size()[0] // 2, pos_y + self.height // 2 - text_label.get_size()[1] // 2))
-    def add_event_listener(self, type: EventType, handler: typing.Callable[[dict], None]) -> None:
-        self.event_listeners[type] = handler
+        return self.rect.copy()
+    def visual_state(self) -> tuple:
+        return (self.x, self.y, self.visible, self.is_clicked, self.disabled, self.text)
+    def hit_test(self, pos: typing.Tuple[int, int]) -> bool:
+        return self.visible and not self.disabled and self.rect.collidepoint(pos)
+    def on_mouse_down(self, pos: typing.Tuple[int, int]) -> None:
+        self.is_clicked = True
+        self.emit(EventType.Mouse_Touch_Start, {EventParam.x: pos[0], EventParam.y: pos[1]})
+    def on_mouse_up(self, pos: typing.Tuple[int, int]) -> None:
+        # Releasing outside the button cancels the click
+        was_clicked, self.is_clicked = self.is_clicked, False
+        if was_clicked and self.hit_test(pos):
+            self.emit(EventType.Mouse_Touch_End, {EventParam.x: pos[0], EventParam.y: pos[1]})
     def set_position(self, x: int = None, y: int = None) -> None:
         pos_x, pos_y = utils.align(x if x is not None else self.x, y if y is not None else self.y, self.width, self.height, self.anchor)
         self.rect.update(pos_x, pos_y, self.width, self.height, self.anchor)
@@ -68,14 +124,55 @@ class Label(Widget):
         self.antialias = antialias
         self.anchor = anchor
         self.font_size = font_size
-        self.font = pygame.font.Font(font, font_size)
-    def draw(self, screen: pygame.surface.Surface) -> None:
-        if not self.visible: return
+        self.font = fonts.get(font, font_size)
+        self.text_surface: pygame.Surface = None
+    def draw(self, screen: pygame.surface.Surface) -> typing.Optional[pygame.Rect]:
+        if not self.visible: return None
 
-        text_label = self.font.render(self.text, self.antialias, self.text_color)
-        screen.blit(text_label, utils.align(self.x, self.y, text_label.get_size()[0], text_label.get_size()[1], self.anchor))
+        if self.text_surface is None:
+            self.text_surface = text_cache.render(self.font, self.text, self.antialias, self.text_color)
+        text_label = self.text_surface
+        return screen.blit(text_label, utils.align(self.x, self.y, text_label.get_size()[0], text_label.get_size()[1], self.anchor))
     def set_text(self, text: str):
+        if text == self.text: return
         self.text = text
+        self.text_surface = None
+    def visual_state(self) -> tuple:
+        return (self.x, self.y, self.visible, self.text)
+
+class Layer(Widget):
+    # Widgets pre-composited into one transparent surface that is only redrawn when one of them changes
+    def __init__(self, widgets: typing.List[Widget], width: int, height: int, x=0, y=0, z=0, visible=True) -> None:
+        super().__init__(x, y, z, visible)
+        self.widgets = sorted(widgets, key=lambda widget: widget.z)
+        self.surface = pygame.Surface((width, height), pygame.SRCALPHA)
+        self.bounds = pygame.Rect(0, 0, 0, 0)
+        self.drawn_state = None
+        self.renders = 0
+
+    def visual_state(self) -> tuple:
+        return (self.x, self.y, self.visible) + tuple(widget.visual_state() for widget in self.widgets)
+
+    def refresh(self) -> None:
+        state = tuple(widget.visual_state() for widget in self.widgets)
+        if state == self.drawn_state: return
+        self.drawn_state = state
+        self.surface.fill((0, 0, 0, 0))
+        rects = [rect for rect in (widget.draw(self.surface) for widget in self.widgets) if rect is not None]
+        self.bounds = rects[0].unionall(rects[1:]) if len(rects) > 0 else pygame.Rect(0, 0, 0, 0)
+        self.renders += 1
+
+    def blit_item(self) -> typing.Optional[tuple]:
+        # (source, dest, area) for Surface.blits, covering only the part the widgets use
+        if not self.visible: return None
+        self.refresh()
+        if self.bounds.width == 0: return None
+        return (self.surface, (self.x + self.bounds.x, self.y + self.bounds.y), self.bounds)
+
+    def draw(self, screen: pygame.surface.Surface) -> typing.Optional[pygame.Rect]:
+        item = self.blit_item()
+        if item is None: return None
+        return screen.blit(*item)
 
 class Animation(Widget):
     def __init__(self, x=0, y=0, z=0, visible=True, sprites: typing.List[str] = [], anchor=Align.Top_Left) -> None:
@@ -88,12 +185,52 @@ class Animation(Widget):
     def run(self, speed: int) -> None:
         self.is_running = True
         self.speed = speed
-    def draw(self, screen: pygame.surface.Surface) -> None:
-        if not self.visible: return
+    def draw(self, screen: pygame.surface.Surface) -> typing.Optional[pygame.Rect]:
+        if not self.visible: return None
         if self.is_running:
             self.current_sprite += self.speed
             if int(self.current_sprite) >= len(self.sprites):
                 self.current_sprite = 0
                 self.is_running = False
         image = self.sprites[int(self.current_sprite)]
-        screen.blit(image, utils.align(self.x, self.y, image.get_size()[0], image.get_size()[1], self.anchor))
+        return screen.blit(image, utils.align(self.x, self.y, image.get_size()[0], image.get_size()[1], self.anchor))
+
+class WidgetDispatcher:
+    # Routes pygame input events to widgets once per event; widgets never poll input while drawing
+    def __init__(self, widgets: typing.Iterable[Widget] = ()) -> None:
+        self.widgets: typing.List[Widget] = []
+        self.pressed: typing.Optional[Widget] = None
+        self.dispatched = 0
+        for widget in widgets: self.add(widget)
+
+    def add(self, widget: Widget) -> None:
+        self.widgets.append(widget)
+        # Hit-test order: highest z first, and among equal z the widget added last is on top
+        order = {id(widget): index for index, widget in enumerate(self.widgets)}
+        self.widgets.sort(key=lambda widget: (-widget.z, -order[id(widget)]))
+
+    def remove(self, widget: Widget) -> None:
+        self.widgets.remove(widget)
+        if self.pressed is widget: self.pressed = None
+
+    def hit(self, pos: typing.Tuple[int, int]) -> typing.Optional[Widget]:
+        for widget in self.widgets:
+            if widget.hit_test(pos): return widget
+        return None
+
+    def dispatch(self, events: typing.Iterable[pygame.event.Event]) -> None:
+        for event in events:
+            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                self.dispatched += 1
+                self.pressed = self.hit(event.pos)
+                if self.pressed is not None: self.pressed.on_mouse_down(event.pos)
+            elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
+                self.dispatched += 1
+                # The widget that took the press gets the release even if the mouse has left it
+                pressed, self.pressed = self.pressed, None
+                if pressed is not None: pressed.on_mouse_up(event.pos)
+            elif event.type in (pygame.KEYDOWN, pygame.KEYUP):
+                self.dispatched += 1
+                type = EventType.Key_Down if event.type == pygame.KEYDOWN else EventType.Key_Up
+                for widget in self.widgets:
+                    if widget.visible and widget.emit(type, {EventParam.key: event.key}): break
@@ -0,0 +1,45 @@
+import time
+import json
+import argparse
+import numpy as np
+from components.env import VectorEnv, NUM_ACTIONS
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure steps/second of the vectorized GameScene environment under random actions.')
+    parser.add_argument('--envs', type=int, default=8)
+    parser.add_argument('--steps', type=int, default=2000, help='vector steps to run')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--frame', type=int, nargs=2, metavar=('W', 'H'), help='also return a downscaled frame buffer of this size')
+    parser.add_argument('--grayscale', action='store_true')
+    parser.add_argument('--frame-stack', type=int, default=1)
+    parser.add_argument('--frame-skip', type=int, default=1)
+    parser.add_argument('--max-steps', type=int, default=5000, help='truncate episodes after this many game ticks')
+    args = parser.parse_args()
+
+    env = VectorEnv(args.envs, args.seed, frame_size=tuple(args.frame) if args.frame else None, grayscale=args.grayscale, frame_stack=args.frame_stack, frame_skip=args.frame_skip, max_steps=args.max_steps)
+    rng = np.random.RandomState(args.seed)
+    env.reset()
+    episodes = 0
+    total_reward = 0.0
+    start = time.perf_counter()
+    for _ in range(args.steps):
+        _, rewards, dones, _ = env.step(rng.randint(0, NUM_ACTIONS, args.envs))
+        total_reward += float(rewards.sum())
+        episodes += int(dones.sum())
+    elapsed = time.perf_counter() - start
+    frames = [game.frames for game in env.envs if game.frames is not None]
+    env.close()
+    print(json.dumps({
+        'envs': args.envs,
+        'vector_steps': args.steps,
+        'env_steps_per_second': args.steps * args.envs / elapsed,
+        'game_ticks_per_second': args.steps * args.envs * args.frame_skip / elapsed,
+        'episodes_finished': episodes,
+        'mean_reward_per_step': total_reward / (args.steps * args.envs),
+        'memory_per_env_bytes': env.envs[0].memory_bytes(),
+        'frame_copies_per_step': sum(buffer.copies for buffer in frames) / (args.steps * args.envs) if frames else 0,
+        'frame_bytes_copied_per_step': sum(buffer.bytes_copied for buffer in frames) / (args.steps * args.envs) if frames else 0,
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
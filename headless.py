@@ -0,0 +1,46 @@
+import argparse
+import json
+from components.simulation import HeadlessRunner
+from components.scene import GameScene
+from components.input import POLICIES, ReplayLog
+from components.profiler import profiler
+
+def main():
+    parser = argparse.ArgumentParser(description='Run GameScene headless at a fixed timestep as fast as possible.')
+    parser.add_argument('--ticks', type=int, default=10000)
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='sweep')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--render', action='store_true', help='draw every tick into the off-screen surface')
+    parser.add_argument('--threaded', action='store_true', help='with --render, draw on a background thread from simulation snapshots')
+    parser.add_argument('--keep-going', action='store_true', help='keep ticking after the game is over')
+    parser.add_argument('--record', metavar='PATH', help='write the per-tick input log of this run to PATH')
+    parser.add_argument('--replay', metavar='PATH', help='replay a recorded input log instead of running a policy')
+    parser.add_argument('--load-state', metavar='PATH', help='start from a saved state instead of a new game')
+    parser.add_argument('--save-state', metavar='PATH', help='write the state of the game at the end of the run to PATH')
+    parser.add_argument('--profile', action='store_true', help='time each subsystem and report rolling averages')
+    parser.add_argument('--trace', metavar='PATH', help='write a Chrome trace of the run to PATH')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    profiler.enabled = args.profile or args.trace is not None
+    if args.trace is not None: profiler.start_trace()
+
+    replay = ReplayLog.load(args.replay) if args.replay else None
+    ticks = len(replay) if replay is not None else args.ticks
+    runner = HeadlessRunner(policy=args.policy, seed=args.seed, render=args.render, replay=replay, record=args.record is not None, threaded=args.threaded)
+    if args.load_state:
+        with open(args.load_state, 'rb') as file:
+            runner.load_state(GameScene.State.from_bytes(file.read()))
+    report = runner.run(ticks, stop_on_end=not args.keep_going)
+    if args.save_state:
+        with open(args.save_state, 'wb') as file:
+            file.write(runner.save_state().to_bytes())
+    runner.close()
+    if args.record:
+        runner.input_source.log.save(args.record)
+    if args.trace:
+        profiler.export_chrome_trace(args.trace)
+    print(json.dumps(report.to_dict(), indent=2) if args.json else report.format())
+
+if __name__ == '__main__':
+    main()
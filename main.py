@@ -1,45 +1,136 @@
+import time
+STARTUP_BEGIN = time.perf_counter()
+
+import json
+import argparse
 import pygame
 import components.scene as scene
-
-pygame.init()
+from components.input import InputRecorder
+from components.profiler import profiler
+from components.assets import assets
+from components.timestep import FixedTimestep
+from components.render_thread import RenderThread
+from components.entity import sprite_registry
 
 # Define constants
 WIN_WIDTH = 600
 WIN_HEIGHT = 600
 FPS = 60
 GAME_TITLE = "Space Shooter"
+DIRTY_RECTS = True
+MAX_CATCH_UP_STEPS = 5
 
-# Create game window
-WINDOW = pygame.display.set_mode((WIN_WIDTH, WIN_HEIGHT))
-pygame.display.set_caption(GAME_TITLE)
-
-scene_manager = scene.SceneManager.getInstance()
+def make_game_factory(record_path: str, seed: int):
+    if record_path is None and seed is None: return None
+    def factory(scene_manager: scene.SceneManager) -> scene.GameScene:
+        game = scene.GameScene(scene_manager, seed=seed)
+        if record_path is not None:
+            game.input_source = InputRecorder(game.input_source, game.seed, record_path)
+        return game
+    return factory
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--measure-startup', action='store_true', help='print import-to-first-frame time and exit')
+    parser.add_argument('--record', metavar='PATH', help='record the input of each game session to PATH')
+    parser.add_argument('--seed', type=int, help='seed for the game session RNG')
+    parser.add_argument('--profile', action='store_true', help='show the per-subsystem frame profiler overlay')
+    parser.add_argument('--trace', metavar='PATH', help='write a Chrome trace of every frame to PATH on exit')
+    parser.add_argument('--render-thread', action='store_true', help='draw game frames on a background thread from snapshots of the simulation')
+    parser.add_argument('--max-catch-up', type=int, default=MAX_CATCH_UP_STEPS, help='most simulation ticks run per rendered frame before the game slows down')
+    args = parser.parse_args()
+    measure_startup = args.measure_startup
+    profiler.enabled = args.profile or args.trace is not None
+    if args.trace is not None: profiler.start_trace()
+
+    # Only the modules StartScene needs; the mixer and game assets load on demand
+    pygame.display.init()
+    pygame.font.init()
+
+    # Create game window
+    window = pygame.display.set_mode((WIN_WIDTH, WIN_HEIGHT))
+    pygame.display.set_caption(GAME_TITLE)
+
+    scene_manager = scene.SceneManager(dirty_rects=DIRTY_RECTS)
+
     running = True
     clock = pygame.time.Clock()
 
-    game_scene = scene.StartScene(scene_manager)
+    game_scene = scene.StartScene(scene_manager, make_game_factory(args.record, args.seed))
     scene_manager.push(game_scene)
+    first_frame = True
+    # Simulation runs in fixed 1/FPS ticks whatever the frame rate; rendering may skip ticks or repeat them
+    timestep = FixedTimestep(1 / FPS, args.max_catch_up)
+    pending_events = []
+    renderer = None
+    if args.render_thread:
+        sprite_registry.load()
+        renderer = RenderThread((WIN_WIDTH, WIN_HEIGHT))
+    threaded_frame = False
 
     while not scene_manager.isEmpty() and running:
         clock.tick(FPS)
-
-        # Draw game objects
-        scene_manager.draw(WINDOW)
-        pygame.display.update()
+        profiler.begin_frame()
 
         # Handle events
-        events = pygame.event.get()
-        for event in events:
-            if event.type == pygame.QUIT:
-                running = False
-        
-        scene_manager.handle_events(events)
+        with profiler.section('input'):
+            events = pygame.event.get()
+            for event in events:
+                if event.type == pygame.QUIT:
+                    running = False
+            pending_events += events
+
+        for _ in range(timestep.advance()):
+            with profiler.section('input'):
+                # Events go to the first tick of the frame; held keys are polled every tick
+                scene_manager.handle_events(pending_events)
+                pending_events = []
+            with profiler.section('sim'):
+                scene_manager.update()
+
+        # Draw game objects
+        snapshot = scene_manager.snapshot(timestep.alpha()) if renderer is not None else None
+        if snapshot is not None:
+            # The render thread draws this one while the next ticks run; show the last frame it finished
+            renderer.submit(snapshot)
+            with profiler.section('present'):
+                presented = renderer.present(window)
+            dirty_rects = None
+            threaded_frame = True
+        else:
+            if renderer is not None: renderer.wait_idle()
+            if threaded_frame: scene_manager.force_full_update = True
+            threaded_frame = False
+            presented = True
+            with profiler.section('draw'):
+                dirty_rects = scene_manager.draw(window, timestep.alpha())
+        if presented:
+            if args.profile:
+                lines = [f'ticks {timestep.steps}  caught up {timestep.caught_up}  dropped {timestep.dropped}']
+                if renderer is not None: lines.append(f'render {renderer.to_dict()["render_ms_mean"]:.2f} ms  dropped {renderer.dropped}')
+                overlay_rect = profiler.draw_overlay(window, lines)
+                if dirty_rects is not None: dirty_rects.append(overlay_rect)
+            with profiler.section('display'):
+                if dirty_rects is None:
+                    pygame.display.update()
+                else:
+                    pygame.display.update(dirty_rects)
 
-        scene_manager.update()
+        if first_frame:
+            first_frame = False
+            if measure_startup:
+                print(json.dumps({'startup_ms': (time.perf_counter() - STARTUP_BEGIN) * 1000, 'asset_loads': assets.loads}))
+                break
+        profiler.end_frame()
 
+    if renderer is not None: renderer.stop()
+    scene_manager.clear()
+    if args.profile:
+        print(json.dumps(timestep.to_dict()))
+        if renderer is not None: print(json.dumps(renderer.to_dict()))
+    if args.trace is not None:
+        profiler.export_chrome_trace(args.trace)
     pygame.quit()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
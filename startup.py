@@ -0,0 +1,37 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import utils.utils as utils
+
+def measure(runs: int) -> dict:
+    env = dict(os.environ, SDL_VIDEODRIVER='dummy', SDL_AUDIODRIVER='dummy', PYGAME_HIDE_SUPPORT_PROMPT='1')
+    first_frame_ms = []
+    process_ms = []
+    asset_loads = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, 'main.py', '--measure-startup'], env=env, capture_output=True, text=True, check=True).stdout
+        process_ms.append((time.perf_counter() - start) * 1000)
+        result = json.loads(output.strip().splitlines()[-1])
+        first_frame_ms.append(result['startup_ms'])
+        asset_loads.append(result['asset_loads'])
+    return {
+        'runs': runs,
+        'first_frame_p50_ms': utils.percentile(first_frame_ms, 50),
+        'first_frame_max_ms': max(first_frame_ms),
+        'process_p50_ms': utils.percentile(process_ms, 50),
+        # Image files decoded before the first frame, on the main thread or by the preload thread
+        'asset_loads_max': max(asset_loads),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure import-to-first-frame time of main.py in fresh processes.')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps(measure(args.runs), indent=2))
+
+if __name__ == '__main__':
+    main()
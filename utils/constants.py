@@ -13,7 +13,11 @@ class Align(enum.Enum):
 
 class EventType(enum.Enum):
     Mouse_Touch_End = 0
+    Mouse_Touch_Start = 1
+    Key_Down = 2
+    Key_Up = 3
 
 class EventParam(enum.Enum):
     x = 'x'
-    y = 'y'
\ No newline at end of file
+    y = 'y'
+    key = 'key'
\ No newline at end of file
@@ -1,5 +1,5 @@
 from utils.constants import Align
-from typing import Tuple
+from typing import Tuple, Sequence
 import pygame
 
 def align(x: int, y: int, width: int, height: int, anchor: Align) -> Tuple[int, int]:
@@ -7,4 +7,10 @@ def align(x: int, y: int, width: int, height: int, anchor: Align) -> Tuple[int,
 
 def scale(img: pygame.Surface, factor: float) -> pygame.Surface:
     w, h = img.get_width() * factor, img.get_height() * factor
-    return pygame.transform.scale(img, (int(w), int(h)))
\ No newline at end of file
+    return pygame.transform.scale(img, (int(w), int(h)))
+
+def percentile(values: Sequence[float], q: float) -> float:
+    if len(values) == 0: return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+    return ordered[index]